@@ -0,0 +1,245 @@
+import asyncio
+import itertools
+from datetime import timedelta
+from functools import total_ordering
+from types import SimpleNamespace
+
+import discord
+
+_ids = itertools.count(10**17)
+
+
+def next_id():
+    return next(_ids)
+
+
+class FakeApi:
+    """Имитация сетевых вызовов Discord: задержка и счётчик запросов"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        # даже без задержки отдаём управление, как настоящий запрос
+        await asyncio.sleep(self.delay)
+
+
+@total_ordering
+class FakeRole:
+    def __init__(self, role_id, name, position):
+        self.id = role_id
+        self.name = name
+        self.position = position
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and self.id == other.id
+
+    def __lt__(self, other):
+        return self.position < other.position
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMember:
+    def __init__(self, api, guild, member_id, name, roles=(), admin=False):
+        self.api = api
+        self.guild = guild
+        self.id = member_id
+        self.name = name
+        self.roles = [guild.default_role, *roles]
+        self.guild_permissions = SimpleNamespace(administrator=admin)
+        self.bot = False
+        self.timed_out_until = None
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    @property
+    def top_role(self):
+        return max(self.roles)
+
+    def __str__(self):
+        return self.name
+
+    async def add_roles(self, *roles, reason=None):
+        await self.api.call()
+        for role in roles:
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles, reason=None):
+        await self.api.call()
+        self.roles = [role for role in self.roles if role not in roles]
+
+    async def timeout(self, until, reason=None):
+        await self.api.call()
+        self.timed_out_until = until
+
+    def is_timed_out(self):
+        return (
+            self.timed_out_until is not None
+            and self.timed_out_until > discord.utils.utcnow()
+        )
+
+
+class FakeGuild:
+    def __init__(self, api, member_count, chat_banned_role_id):
+        self.api = api
+        self.id = next_id()
+        self.default_role = FakeRole(self.id, "@everyone", 0)
+        self.chat_banned_role = FakeRole(chat_banned_role_id, "chat banned", 5)
+        self._roles = {
+            role.id: role
+            for role in (self.default_role, self.chat_banned_role)
+        }
+        self.me = FakeMember(
+            api, self, next_id(), "FunZone", [FakeRole(next_id(), "bot", 50)]
+        )
+        self.owner = FakeMember(api, self, next_id(), "owner", admin=True)
+        self.owner_id = self.owner.id
+        self.members = [
+            FakeMember(api, self, next_id(), f"user{index}")
+            for index in range(member_count)
+        ]
+        self._members = {member.id: member for member in self.members}
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+
+class FakeMessage:
+    def __init__(self, channel, author, created_at, content=""):
+        self.channel = channel
+        self.id = next_id()
+        self.author = author
+        self.created_at = created_at
+        self.content = content
+
+    async def delete(self):
+        await self.channel.api.call()
+        if self.id in self.channel.deleted:
+            raise _not_found()
+        self.channel.deleted.add(self.id)
+
+
+class FakeChannel:
+    """Канал с историей: часть сообщений моложе 14 дней, часть старше"""
+
+    def __init__(self, api, guild, message_count, old_share=0.1):
+        self.api = api
+        self.guild = guild
+        self.id = next_id()
+        self.deleted = set()
+        now = discord.utils.utcnow()
+        old_count = int(message_count * old_share)
+        # от старых к новым, как их выдаёт Discord при oldest_first=True
+        self.messages = [
+            FakeMessage(
+                self,
+                guild.members[index % len(guild.members)],
+                now - timedelta(days=30, seconds=old_count - index),
+            )
+            for index in range(old_count)
+        ] + [
+            FakeMessage(
+                self,
+                guild.members[index % len(guild.members)],
+                now - timedelta(seconds=message_count - index),
+            )
+            for index in range(old_count, message_count)
+        ]
+
+    def __str__(self):
+        return f"#bench-{self.id}"
+
+    @property
+    def remaining(self):
+        return len(self.messages) - len(self.deleted)
+
+    async def history(
+        self, limit=100, before=None, after=None, oldest_first=False
+    ):
+        messages = self.messages if oldest_first else reversed(self.messages)
+        returned = 0
+        for index, message in enumerate(messages):
+            # настоящая история приходит страницами по 100 сообщений
+            if index % 100 == 0:
+                await self.api.call()
+            if message.id in self.deleted:
+                continue
+            if before is not None and message.created_at >= _when(before):
+                continue
+            if after is not None and message.created_at <= after:
+                continue
+            yield message
+            returned += 1
+            if limit is not None and returned >= limit:
+                return
+
+    async def delete_messages(self, messages):
+        await self.api.call()
+        for message in messages:
+            self.deleted.add(message.id)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def defer(self, ephemeral=False, thinking=False):
+        await self.interaction.api.call()
+
+    async def send_message(self, content=None, view=None, ephemeral=False):
+        await self.interaction.api.call()
+        self.interaction.messages.append(content)
+
+    async def edit_message(self, content=None, view=None):
+        await self.interaction.api.call()
+        self.interaction.messages.append(content)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, view=None, ephemeral=False):
+        await self.interaction.api.call()
+        self.interaction.messages.append(content)
+
+
+class FakeInteraction:
+    """То, что команды бота читают из discord.Interaction"""
+
+    def __init__(self, api, guild, user, channel=None):
+        self.api = api
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.created_at = discord.utils.utcnow()
+        self.messages = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.finished = asyncio.Event()
+
+    async def edit_original_response(self, content=None, view=None):
+        await self.api.call()
+        self.messages.append(content)
+        # финальный отчёт /clear приходит без кнопок
+        if view is None:
+            self.finished.set()
+
+
+def _when(value):
+    return value.created_at if isinstance(value, FakeMessage) else value
+
+
+def _not_found():
+    response = SimpleNamespace(status=404, reason="Not Found")
+    return discord.NotFound(response, "Unknown Message")
@@ -0,0 +1,462 @@
+"""Офлайн-бенчмарки горячих путей бота.
+
+Команды /lock, /unlock, /clear и автоматическая разблокировка вызываются
+напрямую с поддельными объектами Discord (fakes.py), вместо MySQL —
+SQLite в памяти (sqlite_db.py). Результаты сравниваются с baselines.json,
+чтобы замедление было видно до деплоя.
+
+    python benchmarks/run.py                     # прогон и сравнение
+    python benchmarks/run.py --update-baseline   # записать новые эталоны
+    python benchmarks/run.py --scenario lock_500 --api-delay-ms 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(
+    os.path.join(ROOT, os.pardir, "docker", "discord_app")
+)
+BASELINE_PATH = os.path.join(ROOT, "baselines.json")
+CHAT_BANNED_ROLE_ID = 4242
+
+
+def percentile(samples, fraction):
+    """Перцентиль по отсортированному списку (метод ближайшего ранга)"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+    return samples[index]
+
+
+def summarize(ops, elapsed, samples, **extra):
+    samples = sorted(samples)
+    return {
+        "ops": ops,
+        "seconds": round(elapsed, 3),
+        "ops_per_second": round(ops / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        **{name: round(value, 3) for name, value in extra.items()},
+    }
+
+
+async def timed(samples, coro):
+    started = time.perf_counter()
+    await coro
+    samples.append(time.perf_counter() - started)
+
+
+class Bench:
+    """Общее окружение сценариев: модуль бота, БД и фейковый Discord"""
+
+    def __init__(self, bot, database, api):
+        self.bot = bot
+        self.database = database
+        self.api = api
+        self.guilds = {}
+        # expire_lock ищет сервер через клиент Discord
+        bot.bot.get_guild = self.guilds.get
+        bot.bot.loop = asyncio.get_running_loop()
+
+    async def reset(self):
+        await self.bot.audit_writer.flush()
+        await self.database.execute("DELETE FROM moderation_logs")
+        self.guilds.clear()
+        await self.bot.load_lock_state()
+
+    def guild(self, member_count):
+        from fakes import FakeGuild
+
+        guild = FakeGuild(self.api, member_count, CHAT_BANNED_ROLE_ID)
+        self.guilds[guild.id] = guild
+        return guild
+
+    async def count(self, query, args=None):
+        row = await self.database.fetchone(query, args)
+        return row[0]
+
+    async def lock_all(self, guild, samples=None):
+        from discord import app_commands
+
+        from fakes import FakeInteraction
+
+        unit = app_commands.Choice(name="минуты", value="minutes")
+        samples = [] if samples is None else samples
+        await asyncio.gather(
+            *(
+                timed(
+                    samples,
+                    self.bot.lock.callback(
+                        FakeInteraction(self.api, guild, guild.owner),
+                        member,
+                        "channel",
+                        "бенчмарк",
+                        10,
+                        unit,
+                    ),
+                )
+                for member in guild.members
+            )
+        )
+        return samples
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+async def scenario_lock(bench, scale):
+    """Параллельные /lock в канале с таймером"""
+    count = int(500 * scale)
+    guild = bench.guild(count)
+    samples = []
+    started = time.perf_counter()
+    await bench.lock_all(guild, samples)
+    elapsed = time.perf_counter() - started
+
+    flush_started = time.perf_counter()
+    await bench.bot.audit_writer.flush()
+    flush = time.perf_counter() - flush_started
+
+    check(len(bench.bot.lock_state) == count, "не все блокировки в памяти")
+    locked = await bench.count(
+        "SELECT COUNT(*) FROM moderation_logs WHERE resolved = FALSE"
+    )
+    check(locked == count, f"в журнале {locked} блокировок из {count}")
+    return summarize(count, elapsed, samples, flush_ms=flush * 1000)
+
+
+async def scenario_unlock(bench, scale):
+    """Параллельные /unlock после такого же числа /lock"""
+    from discord import app_commands
+
+    from fakes import FakeInteraction
+
+    count = int(500 * scale)
+    guild = bench.guild(count)
+    await bench.lock_all(guild)
+    await bench.bot.audit_writer.flush()
+
+    scope = app_commands.Choice(name="Канал", value="channel")
+    samples = []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            timed(
+                samples,
+                bench.bot.unlock.callback(
+                    FakeInteraction(bench.api, guild, guild.owner),
+                    member,
+                    scope,
+                    "бенчмарк",
+                ),
+            )
+            for member in guild.members
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    flush_started = time.perf_counter()
+    await bench.bot.audit_writer.flush()
+    flush = time.perf_counter() - flush_started
+
+    check(len(bench.bot.lock_state) == 0, "блокировки остались в памяти")
+    locked = await bench.count(
+        "SELECT COUNT(*) FROM moderation_logs "
+        "WHERE action = 'lock' AND resolved = FALSE"
+    )
+    check(locked == 0, f"в журнале осталось {locked} блокировок")
+    return summarize(count, elapsed, samples, flush_ms=flush * 1000)
+
+
+async def scenario_clear(bench, scale):
+    """Параллельные /clear в нескольких каналах, 10% сообщений — старые"""
+    from fakes import FakeChannel, FakeInteraction
+
+    channels = max(1, int(20 * scale))
+    messages = 2000
+    guild = bench.guild(50)
+    interactions = [
+        FakeInteraction(
+            bench.api,
+            guild,
+            guild.owner,
+            FakeChannel(bench.api, guild, messages),
+        )
+        for _ in range(channels)
+    ]
+
+    async def clear(interaction):
+        await bench.bot.clear.callback(interaction, amount=messages * 2)
+        await interaction.finished.wait()
+
+    samples = []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(timed(samples, clear(interaction)) for interaction in interactions)
+    )
+    elapsed = time.perf_counter() - started
+
+    left = sum(interaction.channel.remaining for interaction in interactions)
+    check(left == 0, f"не удалено сообщений: {left}")
+    return summarize(channels * messages, elapsed, samples)
+
+
+async def scenario_expired(bench, scale):
+    """Автоматическая разблокировка большого числа истёкших блокировок"""
+    from audit import INSERT_QUERY
+    from expiry import ExpiryScheduler
+
+    count = int(100_000 * scale)
+    guild = bench.guild(count)
+    now = datetime.utcnow()
+    rows = []
+    for index, member in enumerate(guild.members):
+        member.roles.append(guild.chat_banned_role)
+        rows.append(
+            (
+                uuid.uuid4().hex,
+                "lock",
+                guild.owner.id,
+                str(guild.owner),
+                member.id,
+                str(member),
+                "channel",
+                "бенчмарк",
+                10,
+                "minutes",
+                now - timedelta(minutes=10),
+                now - timedelta(seconds=count - index),
+                False,
+                guild.id,
+            )
+        )
+    await bench.database.executemany(INSERT_QUERY, rows)
+    await bench.bot.load_lock_state()
+
+    samples = []
+    expired = 0
+    drained = asyncio.Event()
+
+    async def expire(key, expires_at):
+        nonlocal expired
+        await timed(samples, bench.bot.expire_lock(key, expires_at))
+        expired += 1
+        if expired == count:
+            drained.set()
+
+    scheduler = ExpiryScheduler(
+        bench.bot.load_pending_expiries, expire, sweep_interval=3600
+    )
+    started = time.perf_counter()
+    recovered = await scheduler.recover()
+    recover = time.perf_counter() - started
+    check(recovered == count, f"загружено {recovered} истечений из {count}")
+
+    runner = asyncio.create_task(scheduler.run())
+    await drained.wait()
+    elapsed = time.perf_counter() - started
+    runner.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await runner
+
+    flush_started = time.perf_counter()
+    await bench.bot.audit_writer.flush()
+    flush = time.perf_counter() - flush_started
+
+    locked = await bench.count(
+        "SELECT COUNT(*) FROM moderation_logs WHERE resolved = FALSE"
+    )
+    check(locked == 0, f"в журнале осталось {locked} блокировок")
+    check(len(bench.bot.lock_state) == 0, "блокировки остались в памяти")
+    return summarize(
+        count,
+        elapsed,
+        samples,
+        recover_ms=recover * 1000,
+        flush_ms=flush * 1000,
+    )
+
+
+SCENARIOS = {
+    "lock_500": scenario_lock,
+    "unlock_500": scenario_unlock,
+    "clear_20x2000": scenario_clear,
+    "expired_100k": scenario_expired,
+}
+
+
+def load_bot(workdir):
+    """Импортирует bot.py с окружением, изолированным во временном каталоге"""
+    os.environ.update(
+        {
+            "AUDIT_OUTBOX_PATH": os.path.join(workdir, "outbox.sqlite3"),
+            "CHAT_BANNED_ROLE_ID": str(CHAT_BANNED_ROLE_ID),
+            "GUILD_ID": "0",
+            "METRICS_PORT": "0",
+            "SHARD_COUNT": "",
+        }
+    )
+    sys.path[:0] = [APP_DIR, ROOT]
+    import bot
+
+    return bot
+
+
+def compare(results, baselines, tolerance):
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        slowest = baseline["ops_per_second"] * (1 - tolerance)
+        if result["ops_per_second"] < slowest:
+            regressions.append(
+                f"{name}: {result['ops_per_second']} оп/с "
+                f"(эталон {baseline['ops_per_second']})"
+            )
+        highest = baseline["p99_ms"] * (1 + tolerance)
+        if result["p99_ms"] > highest:
+            regressions.append(
+                f"{name}: p99 {result['p99_ms']} мс "
+                f"(эталон {baseline['p99_ms']})"
+            )
+    return regressions
+
+
+MAIN_COLUMNS = {"ops", "seconds", "ops_per_second", "p50_ms", "p99_ms"}
+
+
+def print_table(results):
+    print(
+        f"{'сценарий':<16}{'операций':>10}{'оп/с':>12}"
+        f"{'p50, мс':>12}{'p99, мс':>12}  прочее"
+    )
+    for name, result in results.items():
+        extra = ", ".join(
+            f"{key}={value}"
+            for key, value in result.items()
+            if key not in MAIN_COLUMNS
+        )
+        print(
+            f"{name:<16}{result['ops']:>10}{result['ops_per_second']:>12}"
+            f"{result['p50_ms']:>12}{result['p99_ms']:>12}  {extra}"
+        )
+
+
+async def run(args, workdir):
+    bot = load_bot(workdir)
+    from fakes import FakeApi
+    from sqlite_db import SQLiteDatabase
+
+    database = SQLiteDatabase()
+    database.install()
+    bench = Bench(bot, database, FakeApi(args.api_delay_ms / 1000))
+
+    results = {}
+    try:
+        for name in args.scenario or SCENARIOS:
+            await bench.reset()
+            print(f"[Bench] {name}...", flush=True)
+            # бот печатает по строке на каждое действие — в замер не пускаем
+            with open(os.devnull, "w") as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    results[name] = await SCENARIOS[name](bench, args.scale)
+    finally:
+        await bot.audit_writer.close()
+        database.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="запустить только этот сценарий (можно несколько раз)",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="множитель размера сценариев; эталоны сравниваются только при 1",
+    )
+    parser.add_argument(
+        "--api-delay-ms",
+        type=float,
+        default=0.0,
+        help="задержка каждого вызова API Discord",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="допустимое ухудшение относительно эталона (0.25 = 25%%)",
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="записать результаты как новые эталоны",
+    )
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+
+    environment = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "api_delay_ms": args.api_delay_ms,
+    }
+    if args.update_baseline:
+        if args.scale != 1:
+            print("[Bench] Эталоны записываются только при --scale 1")
+            return 1
+        stored = {"environment": environment, "scenarios": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as file:
+                stored = json.load(file)
+            stored["environment"] = environment
+        stored["scenarios"].update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(stored, file, indent=2, ensure_ascii=False)
+            file.write("\n")
+        print(f"[Bench] Эталоны сохранены в {args.baseline}")
+        return 0
+
+    if args.scale != 1 or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, "r") as file:
+        stored = json.load(file)
+    if stored.get("environment", {}).get("api_delay_ms") != args.api_delay_ms:
+        print("[Bench] Эталоны сняты с другой задержкой API, сравнения нет")
+        return 0
+    regressions = compare(results, stored["scenarios"], args.tolerance)
+    for regression in regressions:
+        print(f"[Bench] Регрессия: {regression}")
+    if not regressions:
+        print("[Bench] Регрессий относительно эталонов нет")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+import asyncio
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+
+import db
+
+# Итоговая схема после всех миграций, в диалекте SQLite
+SCHEMA = """
+    CREATE TABLE moderation_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id CHAR(32) NULL,
+        guild_id INTEGER NOT NULL DEFAULT 0,
+        action VARCHAR(16) NOT NULL,
+        moderator_id INTEGER NOT NULL,
+        moderator_name VARCHAR(255) NOT NULL,
+        user_id INTEGER NOT NULL,
+        user_name VARCHAR(255) NOT NULL,
+        scope VARCHAR(16) NOT NULL,
+        reason TEXT,
+        amount INT NULL,
+        unit VARCHAR(16) NULL,
+        created_at DATETIME NOT NULL,
+        expires_at DATETIME NULL,
+        resolved BOOLEAN NULL
+    );
+    CREATE UNIQUE INDEX uq_event_id ON moderation_logs (event_id);
+    CREATE INDEX idx_guild_lock_lookup ON moderation_logs (
+        guild_id, user_id, scope, action, resolved, expires_at
+    );
+    CREATE INDEX idx_expiry
+        ON moderation_logs (action, scope, resolved, expires_at);
+    CREATE INDEX idx_history_guild
+        ON moderation_logs (guild_id, created_at, id);
+    CREATE INDEX idx_history_user
+        ON moderation_logs (guild_id, user_id, created_at, id);
+    CREATE INDEX idx_history_moderator
+        ON moderation_logs (guild_id, moderator_id, created_at, id);
+
+    CREATE TABLE guild_settings (
+        guild_id INTEGER PRIMARY KEY,
+        chat_banned_role_id INTEGER NULL,
+        voice_banned_role_id INTEGER NULL,
+        updated_at DATETIME NOT NULL
+    );
+
+    CREATE TABLE stats_daily (
+        guild_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        action VARCHAR(16) NOT NULL,
+        scope VARCHAR(16) NOT NULL,
+        events INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, day, action, scope)
+    );
+    CREATE TABLE stats_scopes (
+        guild_id INTEGER NOT NULL,
+        action VARCHAR(16) NOT NULL,
+        scope VARCHAR(16) NOT NULL,
+        events INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, action, scope)
+    );
+    CREATE TABLE stats_moderators (
+        guild_id INTEGER NOT NULL,
+        moderator_id INTEGER NOT NULL,
+        moderator_name VARCHAR(255) NOT NULL,
+        locks INT NOT NULL DEFAULT 0,
+        unlocks INT NOT NULL DEFAULT 0,
+        last_action_at DATETIME NOT NULL,
+        PRIMARY KEY (guild_id, moderator_id)
+    );
+    CREATE TABLE stats_meta (
+        name VARCHAR(64) PRIMARY KEY,
+        updated_at DATETIME NOT NULL
+    );
+    CREATE TABLE stats_active_locks (
+        guild_id INTEGER NOT NULL,
+        scope VARCHAR(16) NOT NULL,
+        active INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, scope)
+    );
+"""
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+
+@lru_cache(maxsize=None)
+def translate(query):
+    """Переводит запросы бота из диалекта MySQL в SQLite"""
+    query = query.replace("%s", "?")
+    query = query.replace("UTC_TIMESTAMP()", "datetime('now')")
+    query = re.sub(r"MOD\((\w+) >> 22, \?\)", r"((\1 >> 22) % ?)", query)
+    if "ON DUPLICATE KEY UPDATE id = id" in query:
+        query = query.replace("ON DUPLICATE KEY UPDATE id = id", "")
+        query = query.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+    elif "ON DUPLICATE KEY UPDATE" in query:
+        query = query.replace(
+            "ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET"
+        )
+        query = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", query)
+        query = query.replace("GREATEST(", "MAX(")
+    return query
+
+
+def _convert(name, value):
+    # агрегаты (MIN(expires_at)) теряют тип столбца и приходят строкой
+    if isinstance(value, str) and name.endswith("_at"):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _rows(cursor, rows, dictionary):
+    names = [column[0] for column in cursor.description or ()]
+    rows = [
+        tuple(_convert(name, value) for name, value in zip(names, row))
+        for row in rows
+    ]
+    if dictionary:
+        return [dict(zip(names, row)) for row in rows]
+    return rows
+
+
+class _Cursor:
+    def __init__(self, database, cursor):
+        self._database = database
+        self._cursor = cursor
+
+    async def execute(self, query, args=None):
+        await self._database._run(
+            self._cursor.execute, translate(query), tuple(args or ())
+        )
+
+    async def executemany(self, query, rows):
+        await self._database._run(
+            self._cursor.executemany, translate(query), list(rows)
+        )
+
+    async def fetchall(self):
+        return _rows(self._cursor, self._cursor.fetchall(), False)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+
+class SQLiteDatabase:
+    """Замена MySQL для бенчмарков: тот же интерфейс, что у модуля db.
+
+    Запросы выполняются в отдельном потоке по одному, как через пул из
+    одного соединения.
+    """
+
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.executescript(SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = asyncio.Lock()
+        self.queries = 0
+
+    def install(self):
+        """Подменяет функции модуля db, которыми пользуется бот"""
+        db.init_pool = self.init_pool
+        db.close_pool = self.close_pool
+        db.fetchone = self.fetchone
+        db.fetchall = self.fetchall
+        db.execute = self.execute
+        db.transaction = self.transaction
+
+    async def _run(self, func, *args):
+        self.queries += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _query(self, query, args, dictionary, many):
+        cursor = self._conn.execute(translate(query), tuple(args or ()))
+        rows = cursor.fetchall() if many else cursor.fetchmany(1)
+        return _rows(cursor, rows, dictionary)
+
+    async def init_pool(self):
+        return self
+
+    async def close_pool(self):
+        pass
+
+    async def fetchone(self, query, args=None, dictionary=False):
+        async with self._lock:
+            rows = await self._run(self._query, query, args, dictionary, False)
+        return rows[0] if rows else None
+
+    async def fetchall(self, query, args=None, dictionary=False):
+        async with self._lock:
+            return await self._run(self._query, query, args, dictionary, True)
+
+    async def execute(self, query, args=None):
+        async with self._lock:
+            cursor = await self._run(
+                self._conn.execute, translate(query), tuple(args or ())
+            )
+        return cursor.lastrowid
+
+    async def executemany(self, query, rows):
+        async with self.transaction() as cursor:
+            await cursor.executemany(query, rows)
+
+    @asynccontextmanager
+    async def transaction(self):
+        async with self._lock:
+            await self._run(self._conn.execute, "BEGIN")
+            try:
+                yield _Cursor(self, self._conn.cursor())
+            except BaseException:
+                await self._run(self._conn.execute, "ROLLBACK")
+                raise
+            await self._run(self._conn.execute, "COMMIT")
+
+    def close(self):
+        self._executor.shutdown()
+        self._conn.close()
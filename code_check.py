@@ -1,28 +1,264 @@
+import argparse
+import hashlib
+import json
 import os
+import re
 import subprocess  # nosec B404
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 log_dir = "logs/checker_log"
-os.makedirs(log_dir, exist_ok=True)
+cache_path = "logs/code_check_cache.json"
 
-timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+# changing tool configuration invalidates the whole cache
+config_files = [".flake8", "pyproject.toml"]
 
-tools = [
-    ("isort", ["isort", "."]),
-    ("flake8", ["flake8", "."]),
-    ("black", ["black", "."]),
-    ("bandit", ["bandit", "-r", "."]),
+skip_dirs = {
+    ".git",
+    "logs",
+    "__pycache__",
+    ".venv",
+    "venv",
+    ".tox",
+    ".nox",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+}
+
+# formatters rewrite files, so they run one after another and first
+formatters = [
+    ("isort", ["isort"]),
+    ("black", ["black"]),
+]
+
+# analyzers only read files and run in parallel
+analyzers = [
+    ("flake8", ["flake8"]),
+    (
+        "bandit",
+        [
+            "bandit",
+            "-q",
+            "--format",
+            "custom",
+            "--msg-template",
+            "{relpath}:{line}: {test_id} {msg}",
+        ],
+    ),
 ]
 
-for name, command in tools:
-    log_path = os.path.join(log_dir, f"{name}_{timestamp}.log")
-    print(f"[CHECKER] Running {name}...")
-    with open(log_path, "w") as log_file:
-        subprocess.run(
-            command,
-            stdout=log_file,
-            stderr=log_file,
+# "path:line: ..." - an issue line reported by flake8 or bandit
+issue_pattern = re.compile(r"^(?:\./)?(.+?\.py):\d+:")
+
+
+def python_files(root="."):
+    files = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            name
+            for name in dirnames
+            if name not in skip_dirs and not name.endswith(".egg-info")
+        )
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                path = os.path.join(directory, filename)
+                files.append(os.path.relpath(path, root))
+    return files
+
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def config_hash():
+    digest = hashlib.sha256()
+    for path in config_files:
+        if os.path.exists(path):
+            digest.update(path.encode())
+            digest.update(file_hash(path).encode())
+    return digest.hexdigest()
+
+
+def load_cache():
+    """{path: hash} of files that passed every tool on the last run"""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("config") != config_hash():
+        return {}
+    return cache.get("files", {})
+
+
+def save_cache(files):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as file:
+        json.dump({"config": config_hash(), "files": files}, file, indent=1)
+
+
+def run_tool(command, files):
+    """(return code, output); 127 if the tool is not installed"""
+    try:
+        result = subprocess.run(
+            command + files,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
             shell=False,  # explicitly disable shell invocation
         )  # nosec B603
+    except FileNotFoundError:
+        return 127, f"{command[0]}: not installed\n"
+    return result.returncode, result.stdout
+
+
+def chunks(files, count):
+    size = max(1, -(-len(files) // count))
+    return [
+        files[start : start + size] for start in range(0, len(files), size)
+    ]
+
+
+class ToolResult:
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = 0.0
+        self.failed = False
+        self.bad_files = set()
+        self.output = []
+
+
+def run_formatters(files):
+    results = []
+    for name, command in formatters:
+        result = ToolResult(name)
+        started = time.perf_counter()
+        code, output = run_tool(command, files)
+        result.elapsed = time.perf_counter() - started
+        result.output.append(output)
+        if code != 0:
+            # the output does not say reliably which file failed
+            result.failed = True
+            result.bad_files.update(files)
+        results.append(result)
+    return results
+
+
+def run_analyzers(files, workers):
+    """Every analyzer checks its share of files in a separate process"""
+    jobs = [
+        (name, command, part)
+        for name, command in analyzers
+        for part in chunks(files, workers)
+    ]
+    results = {name: ToolResult(name) for name, _ in analyzers}
+
+    def run_job(job):
+        name, command, part = job
+        started = time.perf_counter()
+        code, output = run_tool(command, part)
+        return name, part, code, output, time.perf_counter() - started
+
+    # the checks run in child processes, threads only wait for them
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, part, code, output, elapsed in pool.map(run_job, jobs):
+            result = results[name]
+            # sum of the tool's process times, not wall time
+            result.elapsed += elapsed
+            result.output.append(output)
+            if code == 0:
+                continue
+            result.failed = True
+            reported = {
+                os.path.normpath(match.group(1))
+                for match in map(issue_pattern.match, output.splitlines())
+                if match
+            }
+            # a failure without per-file issues means the tool crashed
+            result.bad_files.update(reported & set(part) or part)
+    return list(results.values())
+
+
+def write_logs(timestamp, results, checked, skipped, elapsed):
+    os.makedirs(log_dir, exist_ok=True)
+    for result in results:
+        log_path = os.path.join(log_dir, f"{result.name}_{timestamp}.log")
+        with open(log_path, "w") as log_file:
+            log_file.write("".join(result.output))
+
+    lines = [
+        f"checked files: {checked}, unchanged (cached): {skipped}",
+        f"total time: {elapsed:.2f}s",
+    ]
+    for result in results:
+        status = "FAILED" if result.failed else "ok"
+        lines.append(
+            f"{result.name:<8} {status:<7} {result.elapsed:7.2f}s  "
+            f"files with issues: {len(result.bad_files)}"
+        )
+        lines.extend(f"    {path}" for path in sorted(result.bad_files))
+    summary = "\n".join(lines) + "\n"
+    summary_path = os.path.join(log_dir, f"summary_{timestamp}.log")
+    with open(summary_path, "w") as log_file:
+        log_file.write(summary)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="isort, black, flake8 and bandit over changed files"
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="ignore the cache and check all"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    cache = {} if args.all else load_cache()
+    all_files = python_files()
+    changed = [
+        path for path in all_files if cache.get(path) != file_hash(path)
+    ]
+    print(f"[CHECKER] {len(changed)} changed of {len(all_files)} files")
+
+    results = []
+    if changed:
+        print("[CHECKER] Running formatters...")
+        results += run_formatters(changed)
+        print("[CHECKER] Running analyzers...")
+        results += run_analyzers(changed, max(1, args.workers))
+
+    bad_files = set()
+    for result in results:
+        bad_files |= result.bad_files
+    # only clean files are cached so problems are reported again; hashes
+    # are taken after formatting so formatted files are not rechecked
+    changed_set = set(changed)
+    save_cache(
+        {
+            path: file_hash(path) if path in changed_set else cache[path]
+            for path in all_files
+            if path not in bad_files
+        }
+    )
+
+    summary = write_logs(
+        timestamp,
+        results,
+        len(changed),
+        len(all_files) - len(changed),
+        time.perf_counter() - started,
+    )
+    print(summary, end="")
+    print(f"[DONE] Logs saved to {log_dir}/")
+    return 1 if any(result.failed for result in results) else 0
+
 
-print(f"[DONE] Logs saved to {log_dir}/")
+if __name__ == "__main__":
+    sys.exit(main())
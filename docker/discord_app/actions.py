@@ -0,0 +1,269 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+import aiohttp
+import discord
+
+from metrics import action_retries
+
+# Чем меньше число, тем раньше выполняется изменение
+PRIORITY_COMMAND = 0
+PRIORITY_BULK = 1
+PRIORITY_BACKGROUND = 2
+
+RETRYABLE_ERRORS = (
+    discord.HTTPException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    OSError,
+)
+
+_UNSET = object()
+
+
+class _MemberChanges:
+    """Накопленные, ещё не отправленные изменения одного участника"""
+
+    def __init__(self, member, priority):
+        self.member = member
+        self.priority = priority
+        self.roles = {}  # role.id -> (role, True — выдать / False — снять)
+        self.timeout = _UNSET
+        self.disconnect = False
+        self.reason = None
+        self.waiters = []
+
+
+def _retryable(error):
+    if not isinstance(error, RETRYABLE_ERRORS):
+        return False
+    if isinstance(error, discord.HTTPException):
+        # 403/404 и прочие ошибки запроса повтор не исправит
+        return error.status == 429 or error.status >= 500
+    return True
+
+
+class ActionExecutor:
+    """Очередь изменений ролей, таймаутов и голосовых подключений участников.
+
+    Изменения одного участника, ждущие в очереди, сливаются: выдача и
+    снятие одной роли сокращаются до последнего, уже выполненное по кэшу
+    Discord не отправляется. Сначала выполняются команды модераторов,
+    потом массовые операции, потом фоновые разблокировки. Запросы к
+    одному серверу идут в одном rate limit bucket Discord, поэтому на
+    сервер ограничено число одновременных запросов. Временные ошибки
+    повторяются с экспоненциальной задержкой. on_change(guild_id,
+    member_id) вызывается после каждой попытки изменить участника.
+    """
+
+    def __init__(
+        self,
+        concurrency=10,
+        per_guild=5,
+        max_attempts=5,
+        base_delay=1.0,
+        max_delay=60.0,
+        on_change=None,
+    ):
+        self.concurrency = concurrency
+        self.per_guild = per_guild
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_change = on_change
+        self._heap = []
+        self._order = itertools.count()
+        self._pending = {}  # (guild_id, member_id) -> _MemberChanges
+        self._running = set()
+        self._touched = {}  # (guild_id, member_id) -> время изменения
+        self._guild_slots = {}
+        self._wakeup = asyncio.Event()
+        self._workers = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _push(self, key, changes):
+        heapq.heappush(
+            self._heap, (changes.priority, next(self._order), key, changes)
+        )
+        self._wakeup.set()
+
+    def _submit(self, member, priority, reason, apply):
+        key = (member.guild.id, member.id)
+        self._touched[key] = time.monotonic()
+        changes = self._pending.get(key)
+        if changes is None:
+            changes = self._pending[key] = _MemberChanges(member, priority)
+            self._push(key, changes)
+        elif priority < changes.priority:
+            # старая запись в куче останется и будет пропущена
+            changes.priority = priority
+            self._push(key, changes)
+        changes.member = member
+        if reason:
+            changes.reason = reason
+        apply(changes)
+
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker())
+                for _ in range(self.concurrency)
+            ]
+        future = asyncio.get_running_loop().create_future()
+        changes.waiters.append(future)
+        return future
+
+    def add_role(self, member, role, reason=None, priority=PRIORITY_COMMAND):
+        def apply(changes):
+            changes.roles[role.id] = (role, True)
+
+        return self._submit(member, priority, reason, apply)
+
+    def remove_role(
+        self, member, role, reason=None, priority=PRIORITY_COMMAND
+    ):
+        def apply(changes):
+            changes.roles[role.id] = (role, False)
+
+        return self._submit(member, priority, reason, apply)
+
+    def timeout(self, member, until, reason=None, priority=PRIORITY_COMMAND):
+        """until=None снимает таймаут"""
+
+        def apply(changes):
+            changes.timeout = until
+
+        return self._submit(member, priority, reason, apply)
+
+    def disconnect(self, member, reason=None, priority=PRIORITY_COMMAND):
+        """Отключает участника от голосового канала"""
+
+        def apply(changes):
+            changes.disconnect = True
+
+        return self._submit(member, priority, reason, apply)
+
+    def recently_changed(self, guild_id, within=60):
+        """id участников, которых бот меняет сейчас или менял недавно.
+
+        Их роли и таймауты в кэше Discord могут ещё не обновиться.
+        """
+        cutoff = time.monotonic() - within
+        busy = self._running | self._pending.keys()
+        self._touched = {
+            key: touched_at
+            for key, touched_at in self._touched.items()
+            if touched_at >= cutoff or key in busy
+        }
+        return {
+            member_id
+            for touched_guild_id, member_id in self._touched
+            if touched_guild_id == guild_id
+        }
+
+    def _next(self):
+        while self._heap:
+            priority, _, key, changes = heapq.heappop(self._heap)
+            if self._pending.get(key) is not changes:
+                continue
+            if priority != changes.priority or key in self._running:
+                # устаревшая запись; занятый участник вернётся в очередь
+                # после завершения текущих изменений
+                continue
+            del self._pending[key]
+            return key, changes
+        return None
+
+    async def _worker(self):
+        while True:
+            item = self._next()
+            if item is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            key, changes = item
+            self._running.add(key)
+            try:
+                error = await self._execute(key[0], changes)
+            finally:
+                self._running.discard(key)
+                self._touched[key] = time.monotonic()
+                if self.on_change is not None:
+                    self.on_change(*key)
+                waiting = self._pending.get(key)
+                if waiting is not None:
+                    self._push(key, waiting)
+            for future in changes.waiters:
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def _execute(self, guild_id, changes):
+        slots = self._guild_slots.get(guild_id)
+        if slots is None:
+            slots = self._guild_slots[guild_id] = asyncio.Semaphore(
+                self.per_guild
+            )
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with slots:
+                    await self._apply(changes)
+                return None
+            except Exception as e:
+                if not _retryable(e) or attempt == self.max_attempts:
+                    return e
+                delay = min(self.max_delay, self.base_delay * 2**attempt)
+                delay = max(delay, getattr(e, "retry_after", 0) or 0)
+                action_retries.inc()
+                print(
+                    f"[Actions] Повтор для {changes.member} через "
+                    f"{delay:.1f} с: {e}"
+                )
+                # джиттер, чтобы повторы не приходили одной волной
+                jitter = random.uniform(0.5, 1.0)  # nosec B311
+                await asyncio.sleep(delay * jitter)
+
+    async def _apply(self, changes):
+        member = changes.member
+        current = {role.id for role in member.roles}
+        to_add = [
+            role
+            for role, add in changes.roles.values()
+            if add and role.id not in current
+        ]
+        to_remove = [
+            role
+            for role, add in changes.roles.values()
+            if not add and role.id in current
+        ]
+        # при повторе уже сделанное не отправляется снова
+        if to_add:
+            await member.add_roles(*to_add, reason=changes.reason)
+            for role in to_add:
+                del changes.roles[role.id]
+        if to_remove:
+            await member.remove_roles(*to_remove, reason=changes.reason)
+        changes.roles.clear()
+
+        if changes.timeout is not _UNSET:
+            if changes.timeout is not None or member.is_timed_out():
+                await member.timeout(changes.timeout, reason=changes.reason)
+            changes.timeout = _UNSET
+
+        if changes.disconnect:
+            if member.voice is not None and member.voice.channel is not None:
+                await member.move_to(None, reason=changes.reason)
+            changes.disconnect = False
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import tempfile
+
+
+def _numeric_key(entry):
+    guild_id, user_id = entry
+    return len(guild_id), guild_id, len(user_id), user_id
+
+
+class Allowlist:
+    """Пользователи, которым разрешён /clear, по серверам; хранится в памяти.
+
+    Строка файла — «guild_id:user_id». Строка с одним user_id осталась от
+    односерверной версии и относится к серверу default_guild_id.
+    """
+
+    def __init__(self, path, default_guild_id=0):
+        self.path = path
+        self.default_guild_id = default_guild_id
+        self.exists = False
+        self._users = set()  # {(guild_id, user_id)} строками
+        self._mtime = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def allowed(self, guild_id, user_id):
+        return (str(guild_id), str(user_id)) in self._users
+
+    def users(self, guild_id):
+        guild_id = str(guild_id)
+        return [
+            user_id
+            for entry_guild_id, user_id in sorted(
+                self._users, key=_numeric_key
+            )
+            if entry_guild_id == guild_id
+        ]
+
+    def _parse(self, line):
+        guild_id, _, user_id = line.rpartition(":")
+        return guild_id or str(self.default_guild_id), user_id
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Перечитывает файл с диска"""
+        mtime = self._file_mtime()
+        if mtime is None:
+            self._users = set()
+        else:
+            with open(self.path, "r") as file:
+                self._users = {
+                    self._parse(line.strip()) for line in file if line.strip()
+                }
+        self.exists = mtime is not None
+        self._mtime = mtime
+        print(f"[Allowlist] Загружено пользователей: {len(self._users)}")
+
+    def reload_if_changed(self):
+        if self._file_mtime() != self._mtime:
+            self.reload()
+
+    def _write(self, users):
+        # пишем во временный файл и атомарно подменяем им старый
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".allowlist-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                for guild_id, user_id in sorted(users, key=_numeric_key):
+                    file.write(f"{guild_id}:{user_id}\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._users = set(users)
+        self.exists = True
+        self._mtime = self._file_mtime()
+
+    async def add(self, guild_id, user_id):
+        """Возвращает False, если пользователь уже в списке сервера"""
+        entry = (str(guild_id), str(user_id))
+        async with self._lock:
+            self.reload_if_changed()
+            if entry in self._users:
+                return False
+            self._write(self._users | {entry})
+            return True
+
+    async def remove(self, guild_id, user_id):
+        """Возвращает False, если пользователя не было в списке сервера"""
+        entry = (str(guild_id), str(user_id))
+        async with self._lock:
+            self.reload_if_changed()
+            if entry not in self._users:
+                return False
+            self._write(self._users - {entry})
+            return True
+
+    async def watch(self, interval=5):
+        """Фоново перечитывает файл, если его изменили вручную"""
+        while True:
+            await asyncio.sleep(interval)
+            async with self._lock:
+                try:
+                    self.reload_if_changed()
+                except OSError as e:
+                    print(f"[Allowlist] Не удалось перечитать файл: {e}")
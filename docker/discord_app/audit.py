@@ -0,0 +1,306 @@
+import asyncio
+import bisect
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aiomysql import Error
+
+import db
+from outbox import Outbox
+from stats import StatsDelta
+
+# event_id + ON DUPLICATE KEY делают повторную доставку безопасной:
+# операция могла дойти до MySQL, но не успеть удалиться из outbox
+INSERT_QUERY = """
+    INSERT INTO moderation_logs (
+        event_id, action, moderator_id, moderator_name, user_id, user_name,
+        scope, reason, amount, unit, created_at, expires_at, resolved,
+        guild_id
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE id = id
+"""
+
+RESOLVE_QUERY = """
+    UPDATE moderation_logs SET resolved = TRUE
+    WHERE user_id = %s AND scope = %s AND action = 'lock'
+    AND resolved = FALSE AND guild_id = %s
+"""
+
+# Длина аргументов без guild_id — так писались операции до появления
+# поддержки нескольких серверов
+LEGACY_ARGS_LENGTH = {"insert": 13, "resolve": 3}
+
+MAX_RETRY_DELAY = 30
+
+
+def _as_datetime(value):
+    # после перезапуска даты приходят из outbox строками
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+class AuditWriter:
+    """Отложенная запись журнала модерации.
+
+    Каждая операция сначала фиксируется в локальном outbox, затем фоновый
+    сброс переносит накопившееся в MySQL одной транзакцией — раз в
+    flush_interval секунд или как только набралось batch_size операций.
+    Порядок операций сохраняется, при недоступности MySQL они ждут в
+    outbox и доставляются после восстановления.
+    """
+
+    def __init__(
+        self,
+        outbox_path,
+        flush_interval=0.5,
+        batch_size=100,
+        default_guild_id=0,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.default_guild_id = default_guild_id
+        self._outbox = Outbox(outbox_path)
+        # SQLite трогаем только из этого потока
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="outbox"
+        )
+        self._ops = [
+            (seq, kind, self._upgrade(kind, args))
+            for seq, kind, args in self._outbox.load()
+        ]
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        if self._ops:
+            print(f"[Audit] В outbox ожидают доставки: {len(self._ops)}")
+
+    def __len__(self):
+        return len(self._ops)
+
+    def _upgrade(self, kind, args):
+        if len(args) == LEGACY_ARGS_LENGTH[kind]:
+            args = args + (self.default_guild_id,)
+        if kind == "insert" and args[6] == "server" and args[12] is None:
+            # записано до того, как у блокировок на сервере появился resolved
+            args = args[:12] + (False,) + args[13:]
+        return args
+
+    async def _push(self, kind, args):
+        loop = asyncio.get_running_loop()
+        seq = await loop.run_in_executor(
+            self._executor, self._outbox.append, kind, args
+        )
+        bisect.insort(self._ops, (seq, kind, args), key=lambda op: op[0])
+        if len(self._ops) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _push_many(self, ops):
+        if not ops:
+            return
+        loop = asyncio.get_running_loop()
+        seqs = await loop.run_in_executor(
+            self._executor, self._outbox.append_many, ops
+        )
+        for seq, (kind, args) in zip(seqs, ops):
+            bisect.insort(self._ops, (seq, kind, args), key=lambda op: op[0])
+        if len(self._ops) >= self.batch_size:
+            self._wakeup.set()
+
+    @staticmethod
+    def _insert_args(
+        action,
+        moderator_id,
+        moderator_name,
+        user_id,
+        user_name,
+        scope,
+        reason,
+        amount=None,
+        unit=None,
+        expires_at=None,
+        guild_id=0,
+    ):
+        # resolved отслеживается у блокировок во всех областях
+        tracked = scope in ("channel", "server", "voice")
+        resolved_value = False if tracked else None
+        return (
+            uuid.uuid4().hex,
+            action,
+            moderator_id,
+            moderator_name,
+            user_id,
+            user_name,
+            scope,
+            reason,
+            amount,
+            unit,
+            datetime.utcnow(),
+            expires_at,
+            resolved_value,
+            guild_id,
+        )
+
+    async def log(self, *args, **kwargs):
+        await self._push("insert", self._insert_args(*args, **kwargs))
+
+    async def log_many(self, events):
+        """events — список kwargs для log(); фиксируются одной транзакцией"""
+        await self._push_many(
+            [("insert", self._insert_args(**event)) for event in events]
+        )
+
+    async def resolve(self, guild_id, user_id, scope, expired_before=None):
+        await self._push("resolve", (user_id, scope, expired_before, guild_id))
+
+    async def resolve_many(self, keys):
+        """keys — [(guild_id, user_id, scope)]; одной транзакцией"""
+        await self._push_many(
+            [
+                ("resolve", (user_id, scope, None, guild_id))
+                for guild_id, user_id, scope in keys
+            ]
+        )
+
+    @staticmethod
+    def _lock_key(kind, args):
+        """(действие, guild_id, user_id, scope) операции"""
+        if kind == "insert":
+            return args[1], args[13], args[4], args[6]
+        return "resolve", args[3], args[0], args[1]
+
+    def pending_lock_state(self, guild_id, user_id, scope):
+        """Состояние блокировки по ещё не доставленным операциям.
+
+        True/False — последняя операция по (guild_id, user_id, scope) её
+        ставит или снимает, None — ничего не известно, нужно спросить БД.
+        """
+        for _, kind, args in reversed(self._ops):
+            action, *key = self._lock_key(kind, args)
+            if key != [guild_id, user_id, scope]:
+                continue
+            if action == "lock":
+                return True
+            if action == "resolve":
+                return False
+        return None
+
+    def pending_changes(self):
+        """Недоставленные изменения блокировок по порядку.
+
+        [("lock" | "resolve", guild_id, user_id, scope, expires_at)]
+        """
+        changes = []
+        for _, kind, args in self._ops:
+            action, guild_id, user_id, scope = self._lock_key(kind, args)
+            if action == "lock":
+                expires_at = _as_datetime(args[11])
+            elif action == "resolve":
+                expires_at = None
+            else:
+                continue
+            changes.append((action, guild_id, user_id, scope, expires_at))
+        return changes
+
+    @staticmethod
+    async def _delivered(cursor, ops):
+        """event_id записей порции, уже доставленных раньше"""
+        event_ids = [args[0] for _, kind, args in ops if kind == "insert"]
+        if not event_ids:
+            return set()
+        placeholders = ", ".join(["%s"] * len(event_ids))
+        await cursor.execute(
+            f"SELECT event_id FROM moderation_logs "
+            f"WHERE event_id IN ({placeholders})",  # nosec B608
+            event_ids,
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+    async def _write(self, ops):
+        async with db.transaction() as cursor:
+            # повторно доставленные записи не должны попасть в статистику
+            delivered = await self._delivered(cursor, ops)
+            delta = StatsDelta()
+            rows = []
+            for _, kind, args in ops:
+                if kind == "insert":
+                    rows.append(args)
+                    if args[0] not in delivered:
+                        delta.add_event(
+                            args[13],
+                            args[1],
+                            args[2],
+                            args[3],
+                            args[6],
+                            _as_datetime(args[10]),
+                            args[12],
+                        )
+                    continue
+                if rows:
+                    await cursor.executemany(INSERT_QUERY, rows)
+                    rows = []
+                user_id, scope, expired_before, guild_id = args
+                if expired_before is None:
+                    await cursor.execute(
+                        RESOLVE_QUERY, (user_id, scope, guild_id)
+                    )
+                else:
+                    await cursor.execute(
+                        RESOLVE_QUERY + " AND expires_at <= %s",
+                        (user_id, scope, guild_id, expired_before),
+                    )
+                delta.add_resolved(guild_id, scope, cursor.rowcount)
+            if rows:
+                await cursor.executemany(INSERT_QUERY, rows)
+            await delta.apply(cursor)
+
+    async def flush(self):
+        """Переносит outbox в MySQL; False — если MySQL недоступен"""
+        async with self._flush_lock:
+            loop = asyncio.get_running_loop()
+            while self._ops:
+                # после простоя outbox может быть большим — идём порциями
+                batch = self._ops[: self.batch_size * 10]
+                try:
+                    await self._write(batch)
+                except (Error, OSError) as e:
+                    print(f"[MySQL] Ошибка при логировании действия: {e}")
+                    return False
+                await loop.run_in_executor(
+                    self._executor, self._outbox.delete_upto, batch[-1][0]
+                )
+                del self._ops[: len(batch)]
+            return True
+
+    async def run(self):
+        delay = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if await self.flush():
+                delay = self.flush_interval
+            else:
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def start(self, loop):
+        self._task = loop.create_task(self.run())
+
+    async def close(self):
+        """Останавливает фоновый сброс и пытается доставить остаток"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._ops:
+            print(
+                f"[Audit] Осталось в outbox до следующего запуска: "
+                f"{len(self._ops)}"
+            )
@@ -1,99 +1,251 @@
 import os
 import re
+import time
+import signal
 import asyncio
 import discord
-import mysql.connector
-from mysql.connector import Error
+from functools import partial
+from aiomysql import Error
 from dotenv import load_dotenv
 from discord.ext import commands
 from discord import app_commands
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
+
+import db
+import metrics
+import migrate
+import stats
+from actions import ActionExecutor, PRIORITY_BACKGROUND, PRIORITY_BULK
+from command_sync import sync_commands
+from allowlist import Allowlist
+from audit import AuditWriter
+from expiry import ExpiryScheduler
+from export import export_logs, temp_export_path
+from gateway import GatewayProfile, MemberLRU, resident_memory
+from guild_config import GuildConfig
+from history import HistoryFilter, HistoryPager, PageCache
+from lock_state import LockState
+from purge import PurgeJob
+from reconcile import find_drift
+from retention import ARCHIVE_TABLE, archive_old_rows, table_stats
+from shards import ShardFilter, parse_shard_ids
+from timeouts import next_deadline, timeout_until
+
+STARTED_AT = time.perf_counter()
+STARTUP_MEMORY = resident_memory()
 
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_TOKEN")
 APPLICATION_ID = os.getenv("DISCORD_APPLICATION_ID")
-CHAT_BANNED_ROLE_ID = int(os.getenv("CHAT_BANNED_ROLE_ID"))
-VOICE_BANNED_ROLE_ID = int(os.getenv("VOICE_BANNED_ROLE_ID"))
+# значения по умолчанию для серверов без своих настроек (/settings)
+CHAT_BANNED_ROLE_ID = int(os.getenv("CHAT_BANNED_ROLE_ID") or 0)
+VOICE_BANNED_ROLE_ID = int(os.getenv("VOICE_BANNED_ROLE_ID") or 0)
+# сервер, к которому относятся записи журнала, сделанные до поддержки
+# нескольких серверов
+GUILD_ID = int(os.getenv("GUILD_ID") or 0)
 
-intents = discord.Intents.default()
-intents.members = True
-intents.message_content = True
-bot = commands.Bot(command_prefix="/", intents=intents, application_id=APPLICATION_ID)
+# Шардирование: SHARD_COUNT=auto — Discord сам подберёт число шардов,
+# SHARD_COUNT=N и SHARD_IDS=0-3 — этот процесс поднимает только свои шарды
+SHARD_COUNT = os.getenv("SHARD_COUNT") or None
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS"))
+shard_options = {}
+if SHARD_COUNT and SHARD_COUNT != "auto":
+    shard_options = {"shard_count": int(SHARD_COUNT), "shard_ids": SHARD_IDS}
+shard_filter = ShardFilter(shard_options.get("shard_count"), SHARD_IDS)
 
-USER_FILE = "clear_users.txt"
+# серверы для мгновенной синхронизации команд вместо глобальной; команды
+# прежнего режима (глобальные или других серверов) при этом снимаются
+SYNC_GUILD_IDS = [int(guild_id) for guild_id in re.findall(r"\d+", os.getenv("SYNC_GUILD_IDS", ""))]
 
-MAX_TIMEOUT_SECONDS = 28 * 24 * 60 * 60
+# GATEWAY_PROFILE=lean — кэш только нужных участников, без кэша сообщений
+gateway = GatewayProfile.from_env()
 
-def log_moderation_action(
-    action, moderator_id, moderator_name, user_id, user_name,
-    scope, reason, amount=None, unit=None, expires_at=None
-):
+# список участников подгружается лениво, когда он действительно нужен
+CHUNK_GUILDS_AT_STARTUP = os.getenv("CHUNK_GUILDS_AT_STARTUP", "0") == "1" and not gateway.lean
+
+startup_timings = []
+
+def mark_startup(phase, started):
+    startup_timings.append((phase, time.perf_counter() - started))
+
+
+class FunZoneBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def setup_hook(self):
+        mark_startup("импорт и вход", STARTED_AT)
+
+        started = time.perf_counter()
+        await ensure_schema(retry=False)
+        mark_startup("схема БД", started)
+
+        started = time.perf_counter()
+        try:
+            synced = await sync_commands(
+                self.tree,
+                os.getenv("COMMAND_HASH_PATH", "data/command_tree.json"),
+                guild_ids=SYNC_GUILD_IDS,
+                force=os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+            )
+            if synced:
+                print(f"Команды успешно синхронизированы: {', '.join(synced)}")
+            else:
+                print("Команды не изменились, синхронизация не нужна")
+        except discord.HTTPException as e:
+            print(f"[Sync] Ошибка при синхронизации команд: {e}")
+        mark_startup("синхронизация команд", started)
+
+        audit_writer.start(self.loop)
+        allowlist.reload()
+        await start_metrics()
+        self.loop.create_task(allowlist.watch())
+        self.loop.create_task(check_expired_locks())
+        self.loop.create_task(reconcile_lock_state())
+        self.loop.create_task(reload_guild_config())
+        self.loop.create_task(run_retention())
+        self.loop.create_task(reconcile_discord_state())
+        # docker stop шлёт SIGTERM — закрываемся штатно, чтобы сбросить журнал
+        self.loop.add_signal_handler(
+            signal.SIGTERM, lambda: self.loop.create_task(self.close())
+        )
+
+    async def close(self):
+        # до super().close(): после закрытия соединения с Discord start()
+        # возвращается, и asyncio.run отменяет эту задачу на полпути
+        await executor.close()
+        await audit_writer.close()
+        await db.close_pool()
+        await super().close()
+
+
+def collect_metrics():
+    metrics.audit_pending.set(len(audit_writer))
+    metrics.active_locks.set(len(lock_state))
+    metrics.action_queue.set(len(executor))
+    metrics.resident_memory.set(resident_memory())
+    metrics.cached_members.set(sum(len(guild.members) for guild in bot.guilds), cache="discord")
+    metrics.cached_members.set(len(member_cache), cache="lru")
+    metrics.cached_messages.set(len(bot.cached_messages))
+
+async def start_metrics():
+    """Поднимает /metrics; METRICS_PORT=0 отключает сервер"""
+    port = int(os.getenv("METRICS_PORT", 9100))
+    if not port:
+        return
+    metrics.install_rate_limit_counter()
+    bot.loop.create_task(metrics.watch_event_loop())
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST"),
-            port=int(os.getenv("MYSQL_PORT", 3306)),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            database=os.getenv("MYSQL_DATABASE")
+        await metrics.start_server(
+            os.getenv("METRICS_HOST", "127.0.0.1"), port, collect=collect_metrics
         )
+    except OSError as e:
+        print(f"[Metrics] Не удалось открыть порт {port}: {e}")
+
+
+bot = FunZoneBot(
+    command_prefix="/",
+    intents=gateway.intents(),
+    member_cache_flags=gateway.member_cache_flags(),
+    max_messages=gateway.message_cache,
+    application_id=APPLICATION_ID,
+    chunk_guilds_at_startup=CHUNK_GUILDS_AT_STARTUP,
+    **shard_options
+)
 
-        cursor = connection.cursor()
+USER_FILE = "clear_users.txt"
+allowlist = Allowlist(USER_FILE, default_guild_id=GUILD_ID)
 
-        query = """
-            INSERT INTO moderation_logs (
-                action, moderator_id, moderator_name, user_id, user_name,
-                scope, reason, amount, unit, created_at, expires_at, resolved
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, UTC_TIMESTAMP(), %s, %s)
-        """
+lock_state = LockState()
+# участники вне кэша discord.py, полученные через API
+member_cache = MemberLRU(
+    max_size=int(os.getenv("MEMBER_LRU_SIZE", 1024)),
+    ttl=int(os.getenv("MEMBER_LRU_SECONDS", 300))
+)
+# все изменения ролей и таймаутов идут через общую очередь; после
+# изменения участник в MemberLRU устаревает
+executor = ActionExecutor(
+    concurrency=int(os.getenv("ACTION_CONCURRENCY", 10)),
+    per_guild=int(os.getenv("ACTION_GUILD_CONCURRENCY", 5)),
+    on_change=member_cache.forget
+)
+guild_config = GuildConfig(CHAT_BANNED_ROLE_ID, VOICE_BANNED_ROLE_ID)
 
-        # resolved только если channel
-        resolved_value = False if scope == 'channel' else None
+# области, где блокировка выдаётся ролью; server — таймаут Discord
+BANNED_ROLE_NAMES = {"channel": "chat banned", "voice": "voice banned"}
 
-        cursor.execute(query, (
-            action, moderator_id, moderator_name, user_id, user_name,
-            scope, reason, amount, unit, expires_at, resolved_value
-        ))
+def banned_role(guild, scope):
+    """Роль блокировки в области scope; None для server"""
+    if scope == "channel":
+        return guild_config.chat_banned_role(guild)
+    if scope == "voice":
+        return guild_config.voice_banned_role(guild)
+    return None
 
-        connection.commit()
+DB_UNAVAILABLE_MESSAGE = "❌ Не удалось проверить активные блокировки: база данных недоступна, попробуйте позже."
 
-    except Error as e:
-        print(f"[MySQL] Ошибка при логировании действия: {e}")
-
-    finally:
-        if 'connection' in locals() and connection.is_connected():
-            cursor.close()
-            connection.close()
+async def ensure_schema(retry=True):
+    """Применяет миграции; если MySQL недоступен — повторяет в фоне"""
+    while True:
+        try:
+            await migrate.migrate()
+            if GUILD_ID:
+                await db.execute(
+                    "UPDATE moderation_logs SET guild_id = %s WHERE guild_id = 0",
+                    (GUILD_ID,)
+                )
+            if await stats.ensure_built():
+                print("[Stats] Агрегаты статистики заполнены по журналу")
+            await guild_config.load()
+            break
+        except (Error, OSError) as e:
+            print(f"[MySQL] Ошибка при применении миграций: {e}")
+            if not retry:
+                bot.loop.create_task(ensure_schema())
+                return
+            await asyncio.sleep(30)
 
+audit_writer = AuditWriter(
+    os.getenv("AUDIT_OUTBOX_PATH", "data/outbox.sqlite3"),
+    flush_interval=int(os.getenv("AUDIT_FLUSH_MS", 500)) / 1000,
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", 100)),
+    default_guild_id=GUILD_ID
+)
 
-def is_user_allowed(user_id):
-    if not os.path.exists(USER_FILE):
-        return False
+async def log_moderation_action(
+    action, moderator_id, moderator_name, user_id, user_name,
+    scope, reason, amount=None, unit=None, expires_at=None, guild_id=0
+):
+    """Пишет запись в локальный outbox, в MySQL она попадёт при сбросе"""
+    await audit_writer.log(
+        action, moderator_id, moderator_name, user_id, user_name,
+        scope, reason, amount, unit, expires_at, guild_id
+    )
+    history_cache.invalidate(guild_id)
 
-    with open(USER_FILE, "r") as file:
-        allowed_users = file.read().splitlines()
 
-    return str(user_id) in allowed_users
+def is_user_allowed(guild_id, user_id):
+    return allowlist.allowed(guild_id, user_id)
 
 @bot.event
 async def on_ready():
-    print(f'{bot.user} подключён')
-    await bot.tree.sync()
-    print("Команды успешно синхронизированы")
-    bot.loop.create_task(check_expired_locks())
+    print(f'{bot.user} подключён ({shard_filter})')
+    # on_ready повторяется после переподключений — отчёт нужен один раз
+    if not any(phase == "готов к работе" for phase, _ in startup_timings):
+        mark_startup("готов к работе", STARTED_AT)
+        report = ", ".join(f"{phase}: {seconds:.2f} с" for phase, seconds in startup_timings)
+        print(f"[Startup] {report}")
+        print(
+            f"[Memory] Профиль {gateway}: при старте {STARTUP_MEMORY / 2**20:.1f} МБ, "
+            f"после подключения {resident_memory() / 2**20:.1f} МБ, "
+            f"участников в кэше {sum(len(guild.members) for guild in bot.guilds)}, "
+            f"сообщений в кэше {len(bot.cached_messages)}"
+        )
 
 @bot.tree.command(name="clear_add", description="Добавить пользователя в список разрешенных")
 async def clear_add(interaction: discord.Interaction, user: discord.User):
     if interaction.user.id == interaction.guild.owner_id:
-        user_id = user.id
-        if os.path.exists(USER_FILE):
-            with open(USER_FILE, "r") as file:
-                allowed_users = file.read().splitlines()
-            if str(user_id) in allowed_users:
-                await interaction.response.send_message(f"Пользователь {user.mention} уже добавлен в список разрешенных.", ephemeral=True)
-                return
-        with open(USER_FILE, "a") as file:
-            file.write(f"{user_id}\n")
+        if not await allowlist.add(interaction.guild.id, user.id):
+            await interaction.response.send_message(f"Пользователь {user.mention} уже добавлен в список разрешенных.", ephemeral=True)
+            return
         await interaction.response.send_message(f"Пользователь {user.mention} добавлен в список разрешенных.", ephemeral=True)
     else:
         await interaction.response.send_message("Только владелец сервера может добавлять пользователей.", ephemeral=True)
@@ -101,23 +253,23 @@ async def clear_add(interaction: discord.Interaction, user: discord.User):
 @bot.tree.command(name="clear_remove", description="Удалить пользователя из списка разрешенных")
 async def clear_remove(interaction: discord.Interaction, user: discord.User):
     if interaction.user.id == interaction.guild.owner_id:
-        user_id = user.id
-        if os.path.exists(USER_FILE):
-            with open(USER_FILE, "r") as file:
-                allowed_users = file.read().splitlines()
-
-            if str(user_id) in allowed_users:
-                allowed_users.remove(str(user_id))
-                with open(USER_FILE, "w") as file:
-                    file.write("\n".join(allowed_users))
-                await interaction.response.send_message(f"Пользователь {user.mention} удален из списка разрешенных.", ephemeral=True)
-            else:
-                await interaction.response.send_message(f"Пользователь {user.mention} не найден в списке.", ephemeral=True)
-        else:
+        if not allowlist.exists:
             await interaction.response.send_message("Файл с разрешенными пользователями не найден.", ephemeral=True)
+        elif await allowlist.remove(interaction.guild.id, user.id):
+            await interaction.response.send_message(f"Пользователь {user.mention} удален из списка разрешенных.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"Пользователь {user.mention} не найден в списке.", ephemeral=True)
     else:
         await interaction.response.send_message("Только владелец сервера может удалять пользователей.", ephemeral=True)
 
+@bot.tree.command(name="clear_reload", description="Перечитать список разрешенных пользователей из файла")
+async def clear_reload(interaction: discord.Interaction):
+    if interaction.user.id == interaction.guild.owner_id:
+        allowlist.reload()
+        await interaction.response.send_message(f"Список перечитан, пользователей на сервере: {len(allowlist.users(interaction.guild.id))}.", ephemeral=True)
+    else:
+        await interaction.response.send_message("Только владелец сервера может перечитывать список.", ephemeral=True)
+
 def get_message_declension(number):
     if number % 10 == 1 and number % 100 != 11:
         return "сообщение"
@@ -126,6 +278,100 @@ def get_message_declension(number):
     else:
         return "сообщений"
 
+purge_jobs = {}
+# столько живёт кнопка «Продолжить» у остановленной очистки — как и токен
+# взаимодействия, через который обновляется прогресс
+PURGE_RESUME_SECONDS = 15 * 60
+
+def format_purge_progress(job, everything=False):
+    declension = get_message_declension(job.deleted)
+    if job.error:
+        return f"❌ Очистка прервана ошибкой. Удалено {job.deleted} {declension}, можно продолжить."
+    if job.cancelled:
+        return f"⏸️ Очистка остановлена. Удалено {job.deleted} {declension}."
+    if job.done:
+        if job.deleted == 0:
+            return "В данном канале нет сообщений."
+        if everything:
+            return f"Все {job.deleted} {declension} в данном канале удалены."
+        return f"Последние {job.deleted} {declension} в данном канале удалены."
+    return (
+        f"🧹 Удалено {job.deleted} {declension}, просмотрено {job.scanned} "
+        f"({job.rate:.1f} в секунду)..."
+    )
+
+async def run_purge(interaction, job, everything=False):
+    """Запускает очистку и показывает прогресс в ответе на interaction"""
+    view = PurgeProgressView(job, interaction.user.id, everything)
+
+    async def report(job):
+        view.refresh()
+        await interaction.edit_original_response(
+            content=format_purge_progress(job, everything),
+            view=None if job.done else view
+        )
+
+    job.on_progress = report
+    purge_jobs[job.channel.id] = job
+    deleted_before = job.deleted
+    try:
+        await job.run()
+    finally:
+        metrics.purged_messages.inc(job.deleted - deleted_before)
+        metrics.purge_rate.set(job.rate)
+        if job.done:
+            purge_jobs.pop(job.channel.id, None)
+            view.stop()
+        else:
+            # остановлена или прервана ошибкой — кнопка «Продолжить» нужна
+            # ещё какое-то время
+            bot.loop.call_later(PURGE_RESUME_SECONDS, expire_purge, job, view)
+
+def expire_purge(job, view):
+    view.stop()
+    if job.resumable and purge_jobs.get(job.channel.id) is job:
+        purge_jobs.pop(job.channel.id)
+
+def start_purge(interaction, job, everything=False):
+    bot.loop.create_task(run_purge(interaction, job, everything))
+
+def purge_running(channel):
+    job = purge_jobs.get(channel.id)
+    return job is not None and job.running
+
+class PurgeProgressView(discord.ui.View):
+    def __init__(self, job, owner_id, everything=False):
+        super().__init__(timeout=None)
+        self.job = job
+        self.owner_id = owner_id
+        self.everything = everything
+        self.refresh()
+
+    def refresh(self):
+        self.stop_button.disabled = self.job.resumable
+        self.resume_button.disabled = not self.job.resumable
+
+    @discord.ui.button(label="Остановить", style=discord.ButtonStyle.danger)
+    async def stop_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Вы не инициировали эту команду.", ephemeral=True)
+            return
+        self.job.cancel()
+        await interaction.response.defer()
+
+    @discord.ui.button(label="Продолжить", style=discord.ButtonStyle.secondary)
+    async def resume_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Вы не инициировали эту команду.", ephemeral=True)
+            return
+        if purge_running(self.job.channel):
+            await interaction.response.send_message("Очистка в этом канале уже идёт.", ephemeral=True)
+            return
+        await interaction.response.defer()
+        # у продолжения будет своё представление
+        self.stop()
+        start_purge(interaction, self.job, self.everything)
+
 class ConfirmClearView(discord.ui.View):
     def __init__(self, interaction, amount):
         super().__init__(timeout=30)
@@ -137,17 +383,14 @@ class ConfirmClearView(discord.ui.View):
         if interaction.user.id != self.interaction.user.id:
             await interaction.response.send_message("Вы не инициировали эту команду.", ephemeral=True)
             return
+        if purge_running(self.interaction.channel):
+            await interaction.response.edit_message(content="Очистка в этом канале уже идёт.", view=None)
+            return
         await interaction.response.defer()
-    
-        deleted_messages = await self.interaction.channel.purge(limit=self.amount)
-        declension = get_message_declension(len(deleted_messages))
-    
-        if len(deleted_messages) == 0:
-            content = "В данном канале нет сообщений."
-        else:
-            content = f"Все {len(deleted_messages)} {declension} в данном канале удалены."
-        await interaction.edit_original_response(content=content, view=None)
-    
+
+        job = PurgeJob(self.interaction.channel, self.amount)
+        start_purge(interaction, job, everything=True)
+
     @discord.ui.button(label="Нет", style=discord.ButtonStyle.secondary)
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.interaction.user.id:
@@ -156,14 +399,68 @@ class ConfirmClearView(discord.ui.View):
 
         await interaction.response.edit_message(content="Удаление отменено.", view=None)
 
+def parse_date(value: str):
+    """Преобразует '2024-05-01' или '2024-05-01 18:30' (UTC) в datetime"""
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return None
+
+DATE_FORMAT_MESSAGE = "❌ Дата указывается в формате `ГГГГ-ММ-ДД` или `ГГГГ-ММ-ДД ЧЧ:ММ`."
+
+def parse_date_range(since: str, until: str):
+    """(since, until) для фильтра по датам; None, если дата не разобрана.
+
+    until без времени включает весь указанный день.
+    """
+    since_date = parse_date(since) if since else None
+    until_date = parse_date(until) if until else None
+    if (since and not since_date) or (until and not until_date):
+        return None
+    if until_date and len(until.strip()) <= len("ГГГГ-ММ-ДД"):
+        until_date += timedelta(days=1)
+    return since_date, until_date
+
+@app_commands.describe(
+    amount="Сколько сообщений удалить",
+    user="Удалять только сообщения этого пользователя",
+    contains="Удалять только сообщения, содержащие текст",
+    before="Удалять сообщения до даты (ГГГГ-ММ-ДД [ЧЧ:ММ], UTC)",
+    after="Удалять сообщения после даты (ГГГГ-ММ-ДД [ЧЧ:ММ], UTC)"
+)
 @bot.tree.command(name="clear", description="Удалить сообщения в канале")
-async def clear(interaction: discord.Interaction, amount: int = 10000):
+async def clear(
+    interaction: discord.Interaction,
+    amount: int = 10000,
+    user: discord.User = None,
+    contains: str = None,
+    before: str = None,
+    after: str = None
+):
     if amount <= 0:
         await interaction.response.send_message("Количество сообщений для удаления должно быть больше 0.", ephemeral=True)
         return
 
-    if interaction.user.id == interaction.guild.owner_id or is_user_allowed(interaction.user.id):
-        if amount == 10000:
+    before_date = parse_date(before) if before else None
+    after_date = parse_date(after) if after else None
+    if (before and not before_date) or (after and not after_date):
+        await interaction.response.send_message(DATE_FORMAT_MESSAGE, ephemeral=True)
+        return
+
+    # без intent message_content текст сообщений пуст — фильтр ничего не найдёт
+    if contains and not gateway.reads_content:
+        await interaction.response.send_message(CONTENT_FILTER_DISABLED_MESSAGE, ephemeral=True)
+        return
+
+    if interaction.user.id == interaction.guild.owner_id or is_user_allowed(interaction.guild.id, interaction.user.id):
+        if purge_running(interaction.channel):
+            await interaction.response.send_message("Очистка в этом канале уже идёт.", ephemeral=True)
+            return
+
+        filtered = user or contains or before_date or after_date
+        if amount == 10000 and not filtered:
             await interaction.response.defer(ephemeral=True)
             channel_link = f"<#{interaction.channel.id}>"
             await interaction.followup.send(
@@ -174,21 +471,22 @@ async def clear(interaction: discord.Interaction, amount: int = 10000):
             return
 
         await interaction.response.defer(ephemeral=True)
-        deleted_messages = await interaction.channel.purge(limit=amount)
-        count = len(deleted_messages)
-        if count == 0:
-            await interaction.followup.send("В данном канале нет сообщений.", ephemeral=True)
-        else:
-            declension = get_message_declension(count)
-            await interaction.followup.send(f"Последние {count} {declension} в данном канале удалены.", ephemeral=True)
+        job = PurgeJob(
+            interaction.channel,
+            amount,
+            author=user,
+            contains=contains,
+            before=before_date,
+            after=after_date
+        )
+        start_purge(interaction, job)
     else:
         await interaction.response.send_message("У вас нет прав для использования этой команды.", ephemeral=True)
 
 @bot.tree.command(name="clear_show", description="Показать добавленных пользователей")
 async def clear_show(interaction: discord.Interaction):
-    if os.path.exists(USER_FILE):
-        with open(USER_FILE, "r") as file:
-            allowed_users = file.read().splitlines()
+    if allowlist.exists:
+        allowed_users = allowlist.users(interaction.guild.id)
 
         if allowed_users:
             user_mentions = []
@@ -244,7 +542,7 @@ def get_time_unit(unit: str, amount: int) -> str:
 
 @app_commands.describe(
     user="Кого ограничить",
-    scope="Канал — только в этом канале, Сервер — на всём сервере",
+    scope="Канал — только в этом канале, Голос — в голосовых каналах, Сервер — на всём сервере",
     amount="Время блокировки",
     unit="Единица времени (секунды, минуты, часы, дни)",
     reason="Причина ограничения"
@@ -261,6 +559,7 @@ def get_time_unit(unit: str, amount: int) -> str:
     scope=[
         app_commands.Choice(name="Сервер", value="server"),
         app_commands.Choice(name="Канал", value="channel"),
+        app_commands.Choice(name="Голос", value="voice"),
     ]
 )
 @app_commands.checks.has_permissions(administrator=True)
@@ -275,6 +574,10 @@ async def lock(
 ):
     await interaction.response.defer(ephemeral=True)
 
+    if scope == "voice" and not gateway.handles_voice:
+        await interaction.followup.send(VOICE_LOCKS_DISABLED_MESSAGE, ephemeral=True)
+        return
+
     if user.guild_permissions.administrator:
         await interaction.followup.send("❌ Нельзя ограничить администратора.", ephemeral=True)
         return
@@ -290,42 +593,38 @@ async def lock(
         )
         return
     
-    if scope == "channel":
-        if await asyncio.to_thread(has_scope_lock, user.id, "server"):
-            await interaction.followup.send(
-                f"❌ У пользователя {user.mention} уже есть активная блокировка `server`.",
-                ephemeral=True
-            )
-            return
-        if await asyncio.to_thread(has_scope_lock, user.id, "channel"):
-            await interaction.followup.send(
-                f"❌ У пользователя {user.mention} уже есть активная блокировка `channel`.",
-                ephemeral=True
-            )
-            return
-    
-    elif scope == "server":
-        if await asyncio.to_thread(has_scope_lock, user.id, "server"):
+    checked_scopes = ["server", scope] if scope != "server" else ["server"]
+    active = await active_lock_scopes(interaction.guild.id, user.id, checked_scopes)
+    if active is None:
+        await interaction.followup.send(DB_UNAVAILABLE_MESSAGE, ephemeral=True)
+        return
+    for checked_scope in checked_scopes:
+        if checked_scope in active:
             await interaction.followup.send(
-                f"❌ У пользователя {user.mention} уже есть активная блокировка `server`.",
+                f"❌ У пользователя {user.mention} уже есть активная блокировка `{checked_scope}`.",
                 ephemeral=True
             )
             return
-    
+
     if amount == 0:
         await interaction.followup.send("⚠️ Значение времени не может быть равно 0.", ephemeral=True)
         return
 
-    if scope == "channel":
-        chat_banned_role = interaction.guild.get_role(CHAT_BANNED_ROLE_ID)
-        if not chat_banned_role:
-            await interaction.followup.send("❌ Не найдена роль chat banned.", ephemeral=True)
+    if scope in BANNED_ROLE_NAMES:
+        role = banned_role(interaction.guild, scope)
+        if not role:
+            await interaction.followup.send(f"❌ Не найдена роль {BANNED_ROLE_NAMES[scope]}.", ephemeral=True)
             return
 
-        await user.add_roles(chat_banned_role, reason=reason)
+        changes = [executor.add_role(user, role, reason=reason)]
+        if scope == "voice":
+            # роль не выгоняет из канала, где участник уже сидит
+            changes.append(executor.disconnect(user, reason=reason))
+        await asyncio.gather(*changes)
 
+        restriction = "заходить в голосовые каналы" if scope == "voice" else "писать в этом канале"
         await interaction.followup.send(
-            f"🔒 {user.mention} теперь не может писать в этом канале.\n**Причина:** {reason}",
+            f"🔒 {user.mention} теперь не может {restriction}.\n**Причина:** {reason}",
             ephemeral=True
         )
 
@@ -334,8 +633,8 @@ async def lock(
             seconds = amount * UNITS[unit.value]
             expires_at = datetime.utcnow() + timedelta(seconds=seconds)
 
-        await asyncio.to_thread(
-            log_moderation_action,
+        await log_moderation_action(
+            guild_id=interaction.guild.id,
             action="lock",
             moderator_id=interaction.user.id,
             moderator_name=str(interaction.user),
@@ -347,6 +646,9 @@ async def lock(
             unit=unit.value if unit else None,
             expires_at=expires_at
         )
+        lock_state.add(interaction.guild.id, user.id, scope, expires_at)
+        if expires_at:
+            expiry_scheduler.schedule((interaction.guild.id, user.id, scope), expires_at)
 
         return
 
@@ -355,35 +657,29 @@ async def lock(
             if unit.value not in UNITS:
                 await interaction.followup.send("❌ Неверно указана единица времени.", ephemeral=True)
                 return
-    
+
             seconds = amount * UNITS[unit.value]
-            if seconds > MAX_TIMEOUT_SECONDS:
-                await interaction.followup.send("❌ Максимальное время таймаута — 28 дней.", ephemeral=True)
-                return
-    
-            until = discord.utils.utcnow() + timedelta(seconds=seconds)
             unit_str = get_time_unit(unit.value, amount)
             duration_text = f"на {amount} {unit_str}"
-    
-            # ✅ добавляем expires_at
             expires_at = datetime.utcnow() + timedelta(seconds=seconds)
         else:
-            until = discord.utils.utcnow() + timedelta(days=28)
-            duration_text = "максимально (28 дней макс)"
-    
-            # ✅ для максимального времени блокировки можно не задавать expires_at (None)
+            duration_text = "бессрочно"
             expires_at = None
-    
+
+        # таймаут Discord не длиннее 28 дней — дальше его продлевает планировщик
+        now = datetime.utcnow()
+        until = timeout_until(expires_at, now).replace(tzinfo=timezone.utc)
+
         try:
-            await user.timeout(until, reason=reason)
+            await executor.timeout(user, until, reason=reason)
     
             await interaction.followup.send(
                 f"🔒 {user.mention} ограничен {duration_text}.\n**Причина:** {reason}",
                 ephemeral=True
             )
     
-            await asyncio.to_thread(
-                log_moderation_action,
+            await log_moderation_action(
+                guild_id=interaction.guild.id,
                 action="lock",
                 moderator_id=interaction.user.id,
                 moderator_name=str(interaction.user),
@@ -395,51 +691,108 @@ async def lock(
                 unit=unit.value if unit else None,
                 expires_at=expires_at  # ✅ сохраняем дату окончания
             )
+            lock_state.add(interaction.guild.id, user.id, scope, expires_at)
+            expiry_scheduler.schedule(
+                (interaction.guild.id, user.id, scope), next_deadline(now, expires_at, now)
+            )
     
         except discord.Forbidden:
             await interaction.followup.send("❌ Нет прав ограничить этого пользователя.", ephemeral=True)
     
-def has_scope_lock(user_id: int, scope: str) -> bool:
+async def has_scope_lock(guild_id: int, user_id: int, scope: str):
+    """True/False, либо None, если состояние сейчас не проверить"""
+    pending = audit_writer.pending_lock_state(guild_id, user_id, scope)
+    if pending is not None:
+        return pending
+
+    query = """
+        SELECT COUNT(*) FROM moderation_logs
+        WHERE guild_id = %s AND user_id = %s AND scope = %s AND action = 'lock'
+        AND resolved = FALSE
+    """
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST"),
-            port=int(os.getenv("MYSQL_PORT", 3306)),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            database=os.getenv("MYSQL_DATABASE")
-        )
-
-        cursor = connection.cursor()
-        query = """
-            SELECT COUNT(*) FROM moderation_logs
-            WHERE user_id = %s AND scope = %s AND action = 'lock'
-            AND (
-                (scope = 'channel' AND resolved = FALSE)
-                OR (scope = 'server' AND (expires_at IS NULL OR expires_at > UTC_TIMESTAMP()))
-            )
-        """
-        cursor.execute(query, (user_id, scope))
-        count = cursor.fetchone()[0]
-        return count > 0
+        row = await db.fetchone(query, (guild_id, user_id, scope))
+        return row[0] > 0
 
     except Error as e:
         print(f"[MySQL] Ошибка при проверке блокировки: {e}")
+        return None
+
+async def active_lock_scopes(guild_id: int, user_id: int, scopes):
+    """Активные области из scopes; None, если состояние сейчас не проверить"""
+    if lock_state.loaded:
+        return lock_state.active_scopes(guild_id, user_id) & set(scopes)
+
+    # состояние ещё не загружено (MySQL был недоступен при старте)
+    active = set()
+    for scope in scopes:
+        locked = await has_scope_lock(guild_id, user_id, scope)
+        if locked is None:
+            return None
+        if locked:
+            active.add(scope)
+    return active
+
+async def resolve_locks(guild_id: int, user_id: int, scope: str, expired_before=None):
+    """Помечает активные блокировки пользователя снятыми"""
+    await audit_writer.resolve(guild_id, user_id, scope, expired_before)
+    history_cache.invalidate(guild_id)
+
+async def load_lock_state():
+    """Загружает активные блокировки из БД с учётом ещё не доставленных"""
+    shard_condition, shard_args = shard_filter.sql()
+    query = f"""
+        SELECT guild_id, user_id, scope, expires_at FROM moderation_logs
+        WHERE action = 'lock'
+        AND resolved = FALSE
+        AND {shard_condition}
+    """  # nosec B608 — условие собирается из констант
+    generation = lock_state.generation
+    # снимок до запроса: сброс outbox во время запроса может перенести
+    # блокировку в БД уже после того, как запрос прочитал таблицу
+    pending = audit_writer.pending_changes()
+    rows = await db.fetchall(query, shard_args, dictionary=True)
+    if lock_state.loaded and generation != lock_state.generation:
+        # пока шёл запрос, состояние изменилось — сверим в следующий раз
         return False
 
-    finally:
-        if 'connection' in locals() and connection.is_connected():
-            cursor.close()
-            connection.close()
+    lock_state.replace(
+        (row["guild_id"], row["user_id"], row["scope"], row["expires_at"])
+        for row in rows
+    )
+    for kind, guild_id, user_id, scope, expires_at in pending:
+        if not shard_filter.owns(guild_id):
+            continue
+        if kind == "lock":
+            lock_state.add(guild_id, user_id, scope, expires_at)
+        else:
+            lock_state.remove(guild_id, user_id, scope)
+    return True
+
+async def reconcile_lock_state():
+    interval = int(os.getenv("LOCK_STATE_RECONCILE_SECONDS", 300))
+    while True:
+        try:
+            if await load_lock_state():
+                print(f"[LockState] Активных блокировок: {len(lock_state)}")
+        except (Error, OSError) as e:
+            print(f"[MySQL] Ошибка при загрузке активных блокировок: {e}")
+
+        if lock_state.loaded and interval <= 0:
+            return
+        # пока состояние не загружено, пробуем чаще
+        await asyncio.sleep(interval if lock_state.loaded else 30)
 
 @app_commands.describe(
     user="Кого разблокировать",
-    scope="Где снять ограничение: канал или сервер",
+    scope="Где снять ограничение: канал, голос или сервер",
     reason="Причина разблокировки"
 )
 @app_commands.choices(
     scope=[
         app_commands.Choice(name="Сервер", value="server"),
         app_commands.Choice(name="Канал", value="channel"),
+        app_commands.Choice(name="Голос", value="voice"),
     ]
 )
 @app_commands.checks.has_permissions(administrator=True)
@@ -460,28 +813,34 @@ async def unlock(
         await interaction.followup.send("❌ У пользователя роль выше или равна роли бота. Снятие невозможно.", ephemeral=True)
         return
     
-    if not await asyncio.to_thread(has_scope_lock, user.id, scope.value):
+    active = await active_lock_scopes(interaction.guild.id, user.id, [scope.value])
+    if active is None:
+        await interaction.followup.send(DB_UNAVAILABLE_MESSAGE, ephemeral=True)
+        return
+
+    if scope.value not in active:
         await interaction.followup.send(
             f"✅ У пользователя {user.mention} нет активной блокировки в области `{scope.value}`.",
             ephemeral=True
         )
         return
 
-    if scope.value == "channel":
-        chat_banned_role = interaction.guild.get_role(CHAT_BANNED_ROLE_ID)
-        if not chat_banned_role:
-            await interaction.followup.send("❌ Роль chat banned не найдена.", ephemeral=True)
+    if scope.value in BANNED_ROLE_NAMES:
+        role = banned_role(interaction.guild, scope.value)
+        if not role:
+            await interaction.followup.send(f"❌ Роль {BANNED_ROLE_NAMES[scope.value]} не найдена.", ephemeral=True)
             return
 
-        if chat_banned_role in user.roles:
-            await user.remove_roles(chat_banned_role, reason=reason)
+        where = "в голосовых каналах" if scope.value == "voice" else "в этом канале"
+        if role in user.roles:
+            await executor.remove_role(user, role, reason=reason)
             await interaction.followup.send(
-                f"🔓 {user.mention} разблокирован в этом канале.\n**Причина:** {reason}",
+                f"🔓 {user.mention} разблокирован {where}.\n**Причина:** {reason}",
                 ephemeral=True
             )
 
-            await asyncio.to_thread(
-                log_moderation_action,
+            await log_moderation_action(
+                guild_id=interaction.guild.id,
                 action="unlock",
                 moderator_id=interaction.user.id,
                 moderator_name=str(interaction.user),
@@ -490,23 +849,26 @@ async def unlock(
                 scope=scope.value,
                 reason=reason
             )
+            await resolve_locks(interaction.guild.id, user.id, scope.value)
+            lock_state.remove(interaction.guild.id, user.id, scope.value)
+            expiry_scheduler.cancel((interaction.guild.id, user.id, scope.value))
 
         else:
             await interaction.followup.send(
-                f"{user.mention} не был заблокирован в канале.",
+                f"{user.mention} не был заблокирован {where}.",
                 ephemeral=True
             )
 
     elif scope.value == "server":
         try:
-            await user.timeout(None, reason=reason)
+            await executor.timeout(user, None, reason=reason)
             await interaction.followup.send(
                 f"🔓 {user.mention} разблокирован на сервере.\n**Причина:** {reason}",
                 ephemeral=True
             )
 
-            await asyncio.to_thread(
-                log_moderation_action,
+            await log_moderation_action(
+                guild_id=interaction.guild.id,
                 action="unlock",
                 moderator_id=interaction.user.id,
                 moderator_name=str(interaction.user),
@@ -515,74 +877,925 @@ async def unlock(
                 scope=scope.value,
                 reason=reason
             )
+            await resolve_locks(interaction.guild.id, user.id, scope.value)
+            lock_state.remove(interaction.guild.id, user.id, scope.value)
+            expiry_scheduler.cancel((interaction.guild.id, user.id, scope.value))
     
         except discord.Forbidden:
             await interaction.followup.send("❌ Нет прав разблокировать пользователя.", ephemeral=True)
 
+@app_commands.describe(
+    chat_banned_role="Роль, которая запрещает писать в каналах",
+    voice_banned_role="Роль, которая запрещает заходить в голосовые каналы"
+)
+@app_commands.checks.has_permissions(administrator=True)
+@bot.tree.command(name="settings", description="Настройки бота на этом сервере")
+async def settings(
+    interaction: discord.Interaction,
+    chat_banned_role: discord.Role = None,
+    voice_banned_role: discord.Role = None
+):
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+
+    fields = {}
+    if chat_banned_role:
+        fields["chat_banned_role_id"] = chat_banned_role.id
+    if voice_banned_role:
+        fields["voice_banned_role_id"] = voice_banned_role.id
+    if fields:
+        try:
+            await guild_config.update(guild.id, **fields)
+        except Error as e:
+            print(f"[MySQL] Ошибка при сохранении настроек: {e}")
+            await interaction.followup.send("❌ Не удалось сохранить настройки: база данных недоступна.", ephemeral=True)
+            return
+
+    chat_role = guild_config.chat_banned_role(guild)
+    voice_role = guild_config.voice_banned_role(guild)
+    await interaction.followup.send(
+        "⚙️ Настройки сервера:\n"
+        f"**Chat banned:** {chat_role.mention if chat_role else 'не задана'}\n"
+        f"**Voice banned:** {voice_role.mention if voice_role else 'не задана'}",
+        ephemeral=True
+    )
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    # самое частое событие шлюза: проверяем только состояние в памяти, без
+    # запросов к БД. Пока оно не загружено, вход запрещают права роли
+    if after.channel is None or after.channel == before.channel:
+        return
+    if not lock_state.is_locked(member.guild.id, member.id, "voice"):
+        return
+    try:
+        await executor.disconnect(member, reason="Блокировка в голосовых каналах")
+        print(f"[Voice] {member} отключён от {after.channel}: блокировка в голосовых каналах")
+    except discord.HTTPException as e:
+        print(f"[Voice] Не удалось отключить {member}: {e}")
+
+@bot.event
+async def on_guild_role_delete(role):
+    guild_config.invalidate(role.guild.id, role.id)
+
+async def reload_guild_config():
+    """Периодически перечитывает guild_settings — их могли поменять другие процессы"""
+    interval = int(os.getenv("GUILD_SETTINGS_RELOAD_SECONDS", 300))
+    while interval > 0:
+        await asyncio.sleep(interval)
+        try:
+            await guild_config.load()
+        except (Error, OSError) as e:
+            print(f"[MySQL] Ошибка при загрузке настроек серверов: {e}")
+
+# завершённые записи старше стольких дней переносятся в архив; 0 — не переносить
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 90))
+last_retention = None
+
+async def run_retention():
+    """Периодически переносит старые записи журнала в архив"""
+    global last_retention
+    if RETENTION_DAYS <= 0:
+        return
+    interval = float(os.getenv("RETENTION_INTERVAL_HOURS", 24)) * 3600
+    # не мешаем загрузке состояния при старте
+    await asyncio.sleep(int(os.getenv("RETENTION_START_DELAY_SECONDS", 300)))
+    while True:
+        try:
+            result = await archive_old_rows(
+                RETENTION_DAYS,
+                batch_size=int(os.getenv("RETENTION_BATCH_SIZE", 500)),
+                pause=int(os.getenv("RETENTION_PAUSE_MS", 100)) / 1000
+            )
+            if result:
+                last_retention = result
+                print(f"[Retention] Перенесено в архив: {result.archived} за {result.elapsed:.1f} с")
+        except (Error, OSError) as e:
+            print(f"[MySQL] Ошибка при архивации журнала: {e}")
+        await asyncio.sleep(interval)
+
+def format_size(size):
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+@app_commands.checks.has_permissions(administrator=True)
+@bot.tree.command(name="db_stats", description="Размер журнала модерации и архива")
+async def db_stats(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        tables = await table_stats()
+        active = await db.fetchall(
+            "SELECT scope, COUNT(*) FROM moderation_logs "
+            "WHERE action = 'lock' AND resolved = FALSE AND guild_id = %s GROUP BY scope",
+            (interaction.guild.id,)
+        )
+    except (Error, OSError) as e:
+        print(f"[MySQL] Ошибка при получении статистики: {e}")
+        await interaction.followup.send("❌ База данных недоступна, попробуйте позже.", ephemeral=True)
+        return
+
+    # размеры таблиц на серверы не делятся
+    lines = ["__Все серверы бота__"]
+    for name in ("moderation_logs", ARCHIVE_TABLE):
+        table = tables.get(name)
+        if table:
+            lines.append(
+                f"**{name}:** ~{table['rows']} строк, данные {format_size(table['data_bytes'])}, "
+                f"индексы {format_size(table['index_bytes'])}"
+            )
+    lines.append(f"**Ожидают записи в БД:** {len(audit_writer)}")
+    if RETENTION_DAYS <= 0:
+        lines.append("**Архивация:** отключена")
+    elif last_retention:
+        finished_at = last_retention.finished_at.replace(tzinfo=timezone.utc)
+        lines.append(
+            f"**Архивация:** записи старше {RETENTION_DAYS} дн., последняя "
+            f"{discord.utils.format_dt(finished_at, 'R')}, перенесено {last_retention.archived}"
+        )
+    else:
+        lines.append(f"**Архивация:** записи старше {RETENTION_DAYS} дн., ещё не запускалась")
+    lines.append("__Этот сервер__")
+    by_scope = ", ".join(
+        f"{SCOPE_LABELS.get(scope, scope)} — {count}" for scope, count in sorted(active)
+    )
+    lines.append(f"**Активных блокировок:** {sum(count for _, count in active)}" + (f" ({by_scope})" if by_scope else ""))
+    in_memory = sum(len(scopes) for scopes in lock_state.guild_locks(interaction.guild.id).values())
+    lines.append(f"**Блокировок в памяти бота:** {in_memory}")
+    await interaction.followup.send("📊 " + "\n".join(lines), ephemeral=True)
+
+MEMBER_ID_PATTERN = re.compile(r"\d{15,20}")
+MEMBER_SCAN_DISABLED_MESSAGE = "❌ Выбор участников по роли и времени входа отключён в этом профиле (MEMBER_SCAN=0)."
+VOICE_LOCKS_DISABLED_MESSAGE = "❌ Блокировка голоса отключена в этом профиле (VOICE_LOCKS=0): бот не видит голосовые каналы."
+CONTENT_FILTER_DISABLED_MESSAGE = "❌ Фильтр по тексту сообщения отключён в этом профиле (CLEAR_CONTENT_FILTER=0)."
+
+async def bulk_active_scopes(guild_id: int, user_ids):
+    """{user_id: {scope, ...}} одним запросом; None, если не проверить"""
+    if lock_state.loaded:
+        return {user_id: lock_state.active_scopes(guild_id, user_id) for user_id in user_ids}
+
+    result = {user_id: set() for user_id in user_ids}
+    if not user_ids:
+        return result
+
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    query = f"""
+        SELECT DISTINCT user_id, scope FROM moderation_logs
+        WHERE guild_id = %s AND user_id IN ({placeholders}) AND action = 'lock'
+        AND resolved = FALSE
+    """  # nosec B608 — подставляются только плейсхолдеры
+    try:
+        rows = await db.fetchall(query, [guild_id, *user_ids])
+    except Error as e:
+        print(f"[MySQL] Ошибка при проверке блокировок: {e}")
+        return None
+
+    for user_id, scope in rows:
+        result[user_id].add(scope)
+    for user_id in user_ids:
+        for scope in ("server", "channel", "voice"):
+            pending = audit_writer.pending_lock_state(guild_id, user_id, scope)
+            if pending is True:
+                result[user_id].add(scope)
+            elif pending is False:
+                result[user_id].discard(scope)
+    return result
+
+async def all_members(guild):
+    """Полный список участников; в lean-профиле без сохранения в кэш"""
+    if gateway.lean:
+        return await guild.chunk(cache=False)
+    if not guild.chunked:
+        await guild.chunk()
+    return guild.members
+
+async def collect_bulk_targets(guild, users=None, role=None, joined_minutes=None):
+    """Участники из списка упоминаний/ID, роли и недавно зашедшие"""
+    targets = {}
+    if users:
+        for raw_id in MEMBER_ID_PATTERN.findall(users):
+            member = await member_cache.get(guild, int(raw_id))
+            if member is not None:
+                targets[member.id] = member
+    if role or joined_minutes:
+        members = await all_members(guild)
+        since = discord.utils.utcnow() - timedelta(minutes=joined_minutes or 0)
+        for member in members:
+            if role and role in member.roles:
+                targets[member.id] = member
+            elif joined_minutes and member.joined_at and member.joined_at >= since:
+                targets[member.id] = member
+    return list(targets.values())
+
+async def run_bulk(members, action):
+    """Выполняет action(member) для всех; параллельность ограничивает executor"""
+
+    async def run_one(member):
+        try:
+            await action(member)
+            return True
+        except discord.HTTPException as e:
+            print(f"[Bulk] Не удалось обработать {member}: {e}")
+            return False
+
+    results = await asyncio.gather(*(run_one(member) for member in members))
+    done = [member for member, ok in zip(members, results) if ok]
+    return done, len(members) - len(done)
+
+def is_protected(guild, member):
+    return member.guild_permissions.administrator or member.top_role >= guild.me.top_role
+
+def format_bulk_summary(title, done, already, protected, failed):
+    lines = [f"{title}: {done}"]
+    if already:
+        lines.append(f"⏭️ Пропущено (уже в нужном состоянии): {already}")
+    if protected:
+        lines.append(f"🛡️ Пропущено (администраторы или роль выше бота): {protected}")
+    if failed:
+        lines.append(f"❌ Ошибок: {failed}")
+    return "\n".join(lines)
+
+@app_commands.describe(
+    scope="Канал — только в этом канале, Голос — в голосовых каналах, Сервер — на всём сервере",
+    reason="Причина ограничения",
+    users="Упоминания или ID пользователей через пробел",
+    role="Ограничить всех участников с этой ролью",
+    joined_minutes="Ограничить всех, кто зашёл за последние N минут",
+    amount="Время блокировки",
+    unit="Единица времени (секунды, минуты, часы, дни)"
+)
+@app_commands.choices(
+    unit=[
+        app_commands.Choice(name="секунды", value="seconds"),
+        app_commands.Choice(name="минуты", value="minutes"),
+        app_commands.Choice(name="часы", value="hours"),
+        app_commands.Choice(name="дни", value="days")
+    ]
+)
+@app_commands.choices(
+    scope=[
+        app_commands.Choice(name="Сервер", value="server"),
+        app_commands.Choice(name="Канал", value="channel"),
+        app_commands.Choice(name="Голос", value="voice"),
+    ]
+)
+@app_commands.checks.has_permissions(administrator=True)
+@bot.tree.command(name="lock_bulk", description="Ограничить сразу нескольких пользователей")
+async def lock_bulk(
+    interaction: discord.Interaction,
+    scope: str,
+    reason: str,
+    users: str = None,
+    role: discord.Role = None,
+    joined_minutes: int = None,
+    amount: int = None,
+    unit: app_commands.Choice[str] = None
+):
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+
+    if not (users or role or joined_minutes):
+        await interaction.followup.send("⚠️ Укажите `users`, `role` или `joined_minutes`.", ephemeral=True)
+        return
+
+    if (role or joined_minutes) and not gateway.scans_members:
+        await interaction.followup.send(MEMBER_SCAN_DISABLED_MESSAGE, ephemeral=True)
+        return
+
+    if scope == "voice" and not gateway.handles_voice:
+        await interaction.followup.send(VOICE_LOCKS_DISABLED_MESSAGE, ephemeral=True)
+        return
+
+    if (amount is None and unit is not None) or (amount is not None and unit is None):
+        await interaction.followup.send(
+            "⚠️ Укажите и `amount`, и `unit` вместе, либо не указывайте вовсе для максимальной блокировки.",
+            ephemeral=True
+        )
+        return
+
+    if amount == 0:
+        await interaction.followup.send("⚠️ Значение времени не может быть равно 0.", ephemeral=True)
+        return
+
+    now = datetime.utcnow()
+    expires_at = None
+    if amount and unit:
+        expires_at = now + timedelta(seconds=amount * UNITS[unit.value])
+    until = timeout_until(expires_at, now).replace(tzinfo=timezone.utc)
+
+    role_to_add = None
+    if scope in BANNED_ROLE_NAMES:
+        role_to_add = banned_role(guild, scope)
+        if not role_to_add:
+            await interaction.followup.send(f"❌ Не найдена роль {BANNED_ROLE_NAMES[scope]}.", ephemeral=True)
+            return
+
+    targets = await collect_bulk_targets(guild, users, role, joined_minutes)
+    active = await bulk_active_scopes(guild.id, [member.id for member in targets])
+    if active is None:
+        await interaction.followup.send(DB_UNAVAILABLE_MESSAGE, ephemeral=True)
+        return
+
+    checked_scopes = {"server", scope}
+    protected = [member for member in targets if is_protected(guild, member)]
+    already = [
+        member for member in targets
+        if member not in protected and active[member.id] & checked_scopes
+    ]
+    to_lock = [member for member in targets if member not in protected and member not in already]
+
+    async def apply(member):
+        if scope == "voice":
+            await asyncio.gather(
+                executor.add_role(member, role_to_add, reason=reason, priority=PRIORITY_BULK),
+                executor.disconnect(member, reason=reason, priority=PRIORITY_BULK)
+            )
+        elif scope == "channel":
+            await executor.add_role(member, role_to_add, reason=reason, priority=PRIORITY_BULK)
+        else:
+            await executor.timeout(member, until, reason=reason, priority=PRIORITY_BULK)
+
+    locked, failed = await run_bulk(to_lock, apply)
+
+    await audit_writer.log_many([
+        dict(
+            guild_id=guild.id,
+            action="lock",
+            moderator_id=interaction.user.id,
+            moderator_name=str(interaction.user),
+            user_id=member.id,
+            user_name=str(member),
+            scope=scope,
+            reason=reason,
+            amount=amount,
+            unit=unit.value if unit else None,
+            expires_at=expires_at
+        )
+        for member in locked
+    ])
+    history_cache.invalidate(guild.id)
+    for member in locked:
+        lock_state.add(guild.id, member.id, scope, expires_at)
+        if scope == "server":
+            expiry_scheduler.schedule((guild.id, member.id, scope), next_deadline(now, expires_at, now))
+        elif expires_at:
+            expiry_scheduler.schedule((guild.id, member.id, scope), expires_at)
+
+    await interaction.followup.send(
+        format_bulk_summary("🔒 Ограничено", len(locked), len(already), len(protected), failed)
+        + f"\n**Причина:** {reason}",
+        ephemeral=True
+    )
+
+@app_commands.describe(
+    scope="Где снять ограничение: канал, голос или сервер",
+    reason="Причина разблокировки",
+    users="Упоминания или ID пользователей через пробел",
+    role="Разблокировать всех участников с этой ролью",
+    joined_minutes="Разблокировать всех, кто зашёл за последние N минут"
+)
+@app_commands.choices(
+    scope=[
+        app_commands.Choice(name="Сервер", value="server"),
+        app_commands.Choice(name="Канал", value="channel"),
+        app_commands.Choice(name="Голос", value="voice"),
+    ]
+)
+@app_commands.checks.has_permissions(administrator=True)
+@bot.tree.command(name="unlock_bulk", description="Снять ограничение сразу с нескольких пользователей")
+async def unlock_bulk(
+    interaction: discord.Interaction,
+    scope: app_commands.Choice[str],
+    reason: str,
+    users: str = None,
+    role: discord.Role = None,
+    joined_minutes: int = None
+):
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+
+    if not (users or role or joined_minutes):
+        await interaction.followup.send("⚠️ Укажите `users`, `role` или `joined_minutes`.", ephemeral=True)
+        return
+
+    if (role or joined_minutes) and not gateway.scans_members:
+        await interaction.followup.send(MEMBER_SCAN_DISABLED_MESSAGE, ephemeral=True)
+        return
+
+    role_to_remove = None
+    if scope.value in BANNED_ROLE_NAMES:
+        role_to_remove = banned_role(guild, scope.value)
+        if not role_to_remove:
+            await interaction.followup.send(f"❌ Роль {BANNED_ROLE_NAMES[scope.value]} не найдена.", ephemeral=True)
+            return
+
+    targets = await collect_bulk_targets(guild, users, role, joined_minutes)
+    active = await bulk_active_scopes(guild.id, [member.id for member in targets])
+    if active is None:
+        await interaction.followup.send(DB_UNAVAILABLE_MESSAGE, ephemeral=True)
+        return
+
+    protected = [member for member in targets if is_protected(guild, member)]
+    not_locked = [
+        member for member in targets
+        if member not in protected and scope.value not in active[member.id]
+    ]
+    to_unlock = [member for member in targets if member not in protected and member not in not_locked]
+
+    async def apply(member):
+        if role_to_remove:
+            await executor.remove_role(member, role_to_remove, reason=reason, priority=PRIORITY_BULK)
+        else:
+            await executor.timeout(member, None, reason=reason, priority=PRIORITY_BULK)
+
+    unlocked, failed = await run_bulk(to_unlock, apply)
+
+    await audit_writer.log_many([
+        dict(
+            guild_id=guild.id,
+            action="unlock",
+            moderator_id=interaction.user.id,
+            moderator_name=str(interaction.user),
+            user_id=member.id,
+            user_name=str(member),
+            scope=scope.value,
+            reason=reason
+        )
+        for member in unlocked
+    ])
+    await audit_writer.resolve_many([(guild.id, member.id, scope.value) for member in unlocked])
+    history_cache.invalidate(guild.id)
+    for member in unlocked:
+        lock_state.remove(guild.id, member.id, scope.value)
+        expiry_scheduler.cancel((guild.id, member.id, scope.value))
+
+    await interaction.followup.send(
+        format_bulk_summary("🔓 Разблокировано", len(unlocked), len(not_locked), len(protected), failed)
+        + f"\n**Причина:** {reason}",
+        ephemeral=True
+    )
+
+history_cache = PageCache(
+    max_pages=int(os.getenv("HISTORY_CACHE_PAGES", 256)),
+    ttl=int(os.getenv("HISTORY_CACHE_SECONDS", 60))
+)
+
+ACTION_LABELS = {"lock": "🔒 Блокировка", "unlock": "🔓 Разблокировка"}
+SCOPE_LABELS = {"server": "сервер", "channel": "канал", "voice": "голос"}
+
+def format_history_entry(row):
+    created_at = row["created_at"].replace(tzinfo=timezone.utc)
+    lines = [
+        f"{row['user_name']} (<@{row['user_id']}>) ← модератор <@{row['moderator_id']}>",
+        discord.utils.format_dt(created_at, "f"),
+    ]
+    if row["amount"] and row["unit"]:
+        lines.append(f"Срок: {row['amount']} {get_time_unit(row['unit'], row['amount'])}")
+    if row["expires_at"]:
+        expires_at = row["expires_at"].replace(tzinfo=timezone.utc)
+        lines.append(f"До: {discord.utils.format_dt(expires_at, 'f')}")
+    if row["action"] == "lock" and row["resolved"]:
+        lines.append("Снята")
+    reason = row["reason"] or "—"
+    if len(reason) > 200:
+        reason = reason[:197] + "..."
+    lines.append(f"**Причина:** {reason}")
+    name = (
+        f"#{row['id']} · {ACTION_LABELS.get(row['action'], row['action'])}"
+        f" · {SCOPE_LABELS.get(row['scope'], row['scope'])}"
+    )
+    return name, "\n".join(lines)
+
+def build_history_embed(pager):
+    embed = discord.Embed(title="История модерации", color=discord.Color.blurple())
+    if not pager.rows:
+        embed.description = "Записей не найдено."
+    for row in pager.rows:
+        name, value = format_history_entry(row)
+        embed.add_field(name=name, value=value, inline=False)
+    embed.set_footer(text=f"Страница {pager.page}")
+    return embed
+
+class HistoryView(discord.ui.View):
+    def __init__(self, pager, owner_id):
+        super().__init__(timeout=300)
+        self.pager = pager
+        self.owner_id = owner_id
+        self.refresh()
+
+    def refresh(self):
+        self.previous_button.disabled = self.pager.page == 1
+        self.next_button.disabled = not self.pager.has_more
+
+    async def turn(self, interaction, load):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Вы не инициировали эту команду.", ephemeral=True)
+            return
+        try:
+            await load()
+        except Error as e:
+            print(f"[MySQL] Ошибка при чтении истории: {e}")
+            await interaction.response.send_message("❌ База данных недоступна, попробуйте позже.", ephemeral=True)
+            return
+        self.refresh()
+        await interaction.response.edit_message(embed=build_history_embed(self.pager), view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, self.pager.previous)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, self.pager.next)
+
+@app_commands.describe(
+    user="Чьи нарушения показать",
+    moderator="Действия какого модератора показать",
+    scope="Область блокировки",
+    action="Тип действия",
+    since="С даты (ГГГГ-ММ-ДД [ЧЧ:ММ], UTC)",
+    until="По дату включительно (ГГГГ-ММ-ДД [ЧЧ:ММ], UTC)"
+)
+@app_commands.choices(
+    scope=[
+        app_commands.Choice(name="Сервер", value="server"),
+        app_commands.Choice(name="Канал", value="channel"),
+        app_commands.Choice(name="Голос", value="voice"),
+    ],
+    action=[
+        app_commands.Choice(name="Блокировка", value="lock"),
+        app_commands.Choice(name="Разблокировка", value="unlock"),
+    ]
+)
+@app_commands.checks.has_permissions(administrator=True)
+@bot.tree.command(name="history", description="История модерации на сервере")
+async def history(
+    interaction: discord.Interaction,
+    user: discord.User = None,
+    moderator: discord.User = None,
+    scope: app_commands.Choice[str] = None,
+    action: app_commands.Choice[str] = None,
+    since: str = None,
+    until: str = None
+):
+    dates = parse_date_range(since, until)
+    if dates is None:
+        await interaction.response.send_message(DATE_FORMAT_MESSAGE, ephemeral=True)
+        return
+    since_date, until_date = dates
+
+    await interaction.response.defer(ephemeral=True)
+    filters = HistoryFilter(
+        interaction.guild.id,
+        user_id=user.id if user else None,
+        moderator_id=moderator.id if moderator else None,
+        scope=scope.value if scope else None,
+        action=action.value if action else None,
+        # в БД время хранится в UTC без часового пояса
+        since=since_date.replace(tzinfo=None) if since_date else None,
+        until=until_date.replace(tzinfo=None) if until_date else None
+    )
+    pager = HistoryPager(filters, history_cache)
+    try:
+        # недоставленные записи тоже должны попасть в историю
+        await audit_writer.flush()
+        await pager.first()
+    except Error as e:
+        print(f"[MySQL] Ошибка при чтении истории: {e}")
+        await interaction.followup.send("❌ База данных недоступна, попробуйте позже.", ephemeral=True)
+        return
+
+    await interaction.followup.send(
+        embed=build_history_embed(pager),
+        view=HistoryView(pager, interaction.user.id),
+        ephemeral=True
+    )
+
+# выгрузки по очереди: каждая держит соединение пула до конца
+export_lock = asyncio.Lock()
+
+@app_commands.describe(
+    user="Чьи записи выгрузить",
+    scope="Область блокировки",
+    since="С даты (ГГГГ-ММ-ДД [ЧЧ:ММ], UTC)",
+    until="По дату включительно (ГГГГ-ММ-ДД [ЧЧ:ММ], UTC)",
+    format="Формат файла"
+)
+@app_commands.choices(
+    scope=[
+        app_commands.Choice(name="Сервер", value="server"),
+        app_commands.Choice(name="Канал", value="channel"),
+        app_commands.Choice(name="Голос", value="voice"),
+    ],
+    format=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="JSON Lines", value="jsonl"),
+    ]
+)
+@app_commands.checks.has_permissions(administrator=True)
+@bot.tree.command(name="export_logs", description="Выгрузить журнал модерации файлом")
+async def export_logs_command(
+    interaction: discord.Interaction,
+    user: discord.User = None,
+    scope: app_commands.Choice[str] = None,
+    since: str = None,
+    until: str = None,
+    format: app_commands.Choice[str] = None
+):
+    dates = parse_date_range(since, until)
+    if dates is None:
+        await interaction.response.send_message(DATE_FORMAT_MESSAGE, ephemeral=True)
+        return
+    since_date, until_date = dates
+    if export_lock.locked():
+        await interaction.response.send_message("⏳ Уже идёт другая выгрузка, попробуйте позже.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    fmt = format.value if format else "csv"
+    filters = HistoryFilter(
+        interaction.guild.id,
+        user_id=user.id if user else None,
+        scope=scope.value if scope else None,
+        since=since_date.replace(tzinfo=None) if since_date else None,
+        until=until_date.replace(tzinfo=None) if until_date else None
+    )
+    path = temp_export_path(fmt)
+    try:
+        async with export_lock:
+            # недоставленные записи тоже должны попасть в выгрузку
+            await audit_writer.flush()
+            result = await export_logs(filters, path, fmt)
+        print(f"[Export] {interaction.guild.name}: {result.rows} записей, {format_size(result.size)} за {result.elapsed:.1f} с")
+
+        if result.size > interaction.guild.filesize_limit:
+            await interaction.followup.send(
+                f"❌ Файл выгрузки ({format_size(result.size)}) больше лимита вложений сервера "
+                f"({format_size(interaction.guild.filesize_limit)}). Сузьте фильтры или используйте `python export.py`.",
+                ephemeral=True
+            )
+            return
+        filename = f"moderation_logs_{interaction.guild.id}.{fmt}.gz"
+        await interaction.followup.send(
+            f"📦 Выгружено записей: {result.rows}",
+            file=discord.File(path, filename=filename),
+            ephemeral=True
+        )
+    except (Error, OSError) as e:
+        print(f"[MySQL] Ошибка при выгрузке журнала: {e}")
+        await interaction.followup.send("❌ База данных недоступна, попробуйте позже.", ephemeral=True)
+    finally:
+        os.remove(path)
+
+def observe_command(interaction, command):
+    name = command.qualified_name if command else "unknown"
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    metrics.command_latency.observe(elapsed, command=name)
+    return name
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    observe_command(interaction, command)
+
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    name = observe_command(interaction, interaction.command)
+    metrics.command_errors.inc(command=name, error=type(error).__name__)
     if isinstance(error, app_commands.errors.MissingPermissions):
         await interaction.response.send_message(
             "❌ У вас нет прав администратора для использования данной команды.",
             ephemeral=True
         )
 
-async def check_expired_locks():
-    await bot.wait_until_ready()
-    while not bot.is_closed():
+async def load_pending_expiries():
+    shard_condition, shard_args = shard_filter.sql()
+    query = f"""
+        SELECT guild_id, user_id, scope,
+            MIN(created_at) AS created_at, MIN(expires_at) AS expires_at
+        FROM moderation_logs
+        WHERE action = 'lock'
+        AND scope IN ('channel', 'server', 'voice')
+        AND resolved = FALSE
+        AND (expires_at IS NOT NULL OR scope = 'server')
+        AND {shard_condition}
+        GROUP BY guild_id, user_id, scope
+    """  # nosec B608 — условие собирается из констант
+    rows = await db.fetchall(query, shard_args, dictionary=True)
+    now = datetime.utcnow()
+    pending = []
+    for row in rows:
+        key = (row["guild_id"], row["user_id"], row["scope"])
+        if row["scope"] == "server":
+            # длинные блокировки ждут не окончания, а продления таймаута
+            pending.append((key, next_deadline(row["created_at"], row["expires_at"], now)))
+        else:
+            pending.append((key, row["expires_at"]))
+    return pending
+
+async def renew_timeout(member, key, deadline):
+    """Продлевает таймаут блокировки на сервере, которая длится дольше 28 дней.
+
+    False — блокировка заканчивается в deadline, её пора снимать.
+    """
+    guild_id, user_id, scope = key
+    if not lock_state.loaded:
+        # не понять, продлевать или снимать; пропущенное продление вернёт
+        # сверка с Discord, когда таймаут закончится
+        raise RuntimeError("активные блокировки ещё не загружены")
+    expires_at = lock_state.expires_at(guild_id, user_id, scope, default=deadline)
+    if expires_at is not None and expires_at <= deadline:
+        return False
+
+    now = datetime.utcnow()
+    # следующее продление планируем сразу — даже если запрос к Discord не пройдёт
+    expiry_scheduler.schedule(key, next_deadline(deadline, expires_at, now))
+    if member:
+        await executor.timeout(
+            member, timeout_until(expires_at, now).replace(tzinfo=timezone.utc),
+            reason="Продление блокировки на сервере", priority=PRIORITY_BACKGROUND
+        )
+    print(f"[AutoUnlock] Продлён таймаут {member or user_id}")
+    return True
+
+async def expire_lock(key, expires_at):
+    guild_id, user_id, scope = key
+    if not shard_filter.owns(guild_id):
+        return
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        # сервер ещё не доступен — подхватим при следующей сверке
+        raise RuntimeError(f"сервер {guild_id} не найден")
+
+    member = await member_cache.get(guild, user_id)
+    if scope == "server":
+        # сам таймаут Discord снимет в expires_at, остаётся отметить запись
+        if await renew_timeout(member, key, expires_at):
+            return
+    role = banned_role(guild, scope)
+    if member and role and role in member.roles:
         try:
-            connection = mysql.connector.connect(
-                host=os.getenv("MYSQL_HOST"),
-                port=int(os.getenv("MYSQL_PORT", 3306)),
-                user=os.getenv("MYSQL_USER"),
-                password=os.getenv("MYSQL_PASSWORD"),
-                database=os.getenv("MYSQL_DATABASE")
+            await executor.remove_role(
+                member, role, reason="Автоматическая разблокировка",
+                priority=PRIORITY_BACKGROUND
             )
-            cursor = connection.cursor(dictionary=True)
-
-            query = """
-                SELECT * FROM moderation_logs
-                WHERE action = 'lock'
-                AND scope = 'channel'
-                AND resolved = FALSE
-                AND expires_at IS NOT NULL
-                AND expires_at <= UTC_TIMESTAMP()
-            """
-            cursor.execute(query)
-            expired_locks = cursor.fetchall()
-
-            for lock in expired_locks:
-                guild = bot.get_guild(int(os.getenv("GUILD_ID")))
-                if not guild:
-                    continue
-
-                member = guild.get_member(lock["user_id"])
-                if not member:
-                    continue
-
-                role = guild.get_role(CHAT_BANNED_ROLE_ID)
-                if role and role in member.roles:
-                    try:
-                        await member.remove_roles(role, reason="Автоматическая разблокировка")
-                    except Exception as e:
-                        print(f"[AutoUnlock] Не удалось снять роль: {e}")
-
-                update_query = """
-                    UPDATE moderation_logs SET resolved = TRUE
-                    WHERE id = %s
-                """
-                cursor.execute(update_query, (lock["id"],))
-                connection.commit()
-                print(f"[AutoUnlock] Разблокирован {member} в области {lock['scope']}")
-
-        except Error as e:
-            print(f"[MySQL] Ошибка при проверке истекших блокировок: {e}")
+        except Exception as e:
+            print(f"[AutoUnlock] Не удалось снять роль: {e}")
+
+    await resolve_locks(guild_id, user_id, scope, expired_before=expires_at)
+    lock_state.remove(guild_id, user_id, scope)
+    metrics.expiry_lag_seconds.observe(
+        max(0.0, (datetime.utcnow() - expires_at).total_seconds()), scope=scope
+    )
+    print(f"[AutoUnlock] Разблокирован {member or user_id} в области {scope}")
+
+expiry_scheduler = ExpiryScheduler(
+    load_pending_expiries,
+    expire_lock,
+    sweep_interval=int(os.getenv("EXPIRY_SWEEP_SECONDS", 600)),
+    concurrency=int(os.getenv("EXPIRY_CONCURRENCY", 50))
+)
 
-        finally:
-            if 'connection' in locals() and connection.is_connected():
-                cursor.close()
-                connection.close()
+async def check_expired_locks():
+    await bot.wait_until_ready()
+    try:
+        count = await expiry_scheduler.recover()
+        print(f"[AutoUnlock] Загружено ожидающих разблокировок: {count}")
+    except Error as e:
+        print(f"[MySQL] Ошибка при проверке истекших блокировок: {e}")
+
+    bot.loop.create_task(expiry_scheduler.sweep())
+    await expiry_scheduler.run()
+
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 50))
+# 1 — журнал главный: сверка отменяет выданные и снятые вручную роли и
+# таймауты; по умолчанию ручные действия записываются в журнал
+RECONCILE_ENFORCE = os.getenv("RECONCILE_ENFORCE", "0") == "1"
+
+async def locks_started_at(guild_id: int, members):
+    """{(user_id, scope): начало активной блокировки} для участников members"""
+    user_ids = list({member.id for member in members})
+    if not user_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    query = f"""
+        SELECT user_id, scope, MIN(created_at) FROM moderation_logs
+        WHERE guild_id = %s AND user_id IN ({placeholders}) AND action = 'lock'
+        AND resolved = FALSE
+        GROUP BY user_id, scope
+    """  # nosec B608 — подставляются только плейсхолдеры
+    rows = await db.fetchall(query, [guild_id, *user_ids])
+    return {(user_id, scope): created_at for user_id, scope, created_at in rows}
+
+async def reconcile_guild(guild):
+    """Сверяет роли и таймауты участников сервера с журналом; (drift, ошибок)"""
+    roles = {scope: banned_role(guild, scope) for scope in BANNED_ROLE_NAMES}
+    drift = find_drift(
+        await all_members(guild),
+        lock_state.guild_locks(guild.id),
+        roles,
+        skip=executor.recently_changed(guild.id),
+        enforce=RECONCILE_ENFORCE
+    )
+    if drift.missing_role:
+        drift.split_missing_roles(
+            await locks_started_at(guild.id, [member for member, _, _ in drift.missing_role])
+        )
 
-        await asyncio.sleep(60)  # Проверка каждую минуту
+    reason = "Сверка с журналом модерации"
+    background = dict(reason=reason, priority=PRIORITY_BACKGROUND)
+    changes = (
+        [partial(executor.add_role, member, role, **background) for member, role in drift.add_role]
+        + [partial(executor.remove_role, member, role, **background) for member, role in drift.remove_role]
+        + [partial(executor.timeout, member, until, **background) for member, until in drift.reapply_timeout]
+    )
+    failed = 0
+    # порциями, чтобы не занять всю очередь executor'а разом
+    for start in range(0, len(changes), RECONCILE_BATCH_SIZE):
+        batch = changes[start:start + RECONCILE_BATCH_SIZE]
+        results = await asyncio.gather(*(change() for change in batch), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                failed += 1
+                print(f"[Reconcile] Не удалось исправить участника: {result}")
+
+    # ручные действия модераторов в Discord переносятся в журнал
+    moderator = dict(guild_id=guild.id, moderator_id=guild.me.id, moderator_name=str(guild.me))
+    recorded = [
+        dict(
+            action="lock",
+            user_id=member.id,
+            user_name=str(member),
+            scope="server",
+            reason="Таймаут выдан в Discord в обход бота",
+            expires_at=member.timed_out_until.replace(tzinfo=None),
+            **moderator
+        )
+        for member in drift.record_timeout
+    ] + [
+        dict(
+            action="lock",
+            user_id=member.id,
+            user_name=str(member),
+            scope=scope,
+            reason="Роль выдана в Discord в обход бота",
+            **moderator
+        )
+        for member, scope in drift.record_role
+    ] + [
+        dict(
+            action="unlock",
+            user_id=member.id,
+            user_name=str(member),
+            scope=scope,
+            reason="Блокировка снята в Discord в обход бота",
+            **moderator
+        )
+        for member, scope in drift.resolve
+    ]
+    if recorded:
+        await audit_writer.log_many(recorded)
+        await audit_writer.resolve_many([(guild.id, member.id, scope) for member, scope in drift.resolve])
+        history_cache.invalidate(guild.id)
+
+    now = datetime.utcnow()
+    for member in drift.record_timeout:
+        expires_at = member.timed_out_until.replace(tzinfo=None)
+        lock_state.add(guild.id, member.id, "server", expires_at)
+        expiry_scheduler.schedule((guild.id, member.id, "server"), next_deadline(now, expires_at, now))
+    for member, scope in drift.record_role:
+        lock_state.add(guild.id, member.id, scope, None)
+    for member, scope in drift.resolve:
+        lock_state.remove(guild.id, member.id, scope)
+        expiry_scheduler.cancel((guild.id, member.id, scope))
+    return drift, failed
+
+async def reconcile_discord_state():
+    """При старте и раз в RECONCILE_SECONDS сверяет Discord с журналом"""
+    interval = int(os.getenv("RECONCILE_SECONDS", 3600))
+    if not gateway.scans_members:
+        print("[Reconcile] Сверка отключена: нет доступа к списку участников (MEMBER_SCAN=0)")
+        return
+    await bot.wait_until_ready()
+    while True:
+        try:
+            # одно чтение активных блокировок на все серверы процесса
+            if await load_lock_state():
+                for guild in bot.guilds:
+                    if not shard_filter.owns(guild.id):
+                        continue
+                    drift, failed = await reconcile_guild(guild)
+                    if drift or failed:
+                        print(f"[Reconcile] {guild.name}: {drift.summary()}, ошибок: {failed}")
+        except (Error, OSError) as e:
+            print(f"[MySQL] Ошибка при сверке с журналом: {e}")
+        except discord.HTTPException as e:
+            print(f"[Reconcile] Ошибка Discord при сверке: {e}")
+
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval if lock_state.loaded else 60)
 
-bot.run(TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    bot.run(TOKEN)
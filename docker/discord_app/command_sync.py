@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+
+import discord
+
+
+def tree_hash(tree, guild=None):
+    """Хэш описаний команд — меняется только при изменении самих команд"""
+    payload = sorted(
+        (command.to_dict() for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+# отметка в файле хэшей: команды цели сняты с Discord
+CLEARED = "cleared"
+
+
+def _load_hashes(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_hashes(path, hashes):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(hashes, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+async def _clear(tree, name):
+    """Снимает с Discord команды, синхронизированные раньше в цель name"""
+    application_id = tree.client.application_id
+    if name == "global":
+        await tree.client.http.bulk_upsert_global_commands(
+            application_id, payload=[]
+        )
+    else:
+        await tree.client.http.bulk_upsert_guild_commands(
+            application_id, int(name), payload=[]
+        )
+
+
+async def sync_commands(tree, state_path, guild_ids=None, force=False):
+    """Синхронизирует команды, только если они изменились с прошлого раза.
+
+    guild_ids — синхронизировать на эти серверы (мгновенно) вместо
+    глобальной синхронизации. Команды, оставшиеся от другого режима,
+    снимаются один раз: иначе на серверах из guild_ids каждая команда
+    видна дважды — глобальная и серверная копия. Возвращает список
+    синхронизированных целей.
+    """
+    hashes = _load_hashes(state_path)
+    application_id = str(tree.client.application_id)
+    if guild_ids:
+        targets = [
+            (str(guild_id), discord.Object(id=guild_id))
+            for guild_id in guild_ids
+        ]
+        for _, guild in targets:
+            tree.copy_global_to(guild=guild)
+    else:
+        targets = [("global", None)]
+
+    # про прежние цели известно из файла хэшей; глобальные команды могли
+    # остаться и без записи в нём
+    prefix = f"{application_id}:"
+    stale = {key[len(prefix) :] for key in hashes if key.startswith(prefix)}
+    if guild_ids:
+        stale.add("global")
+
+    synced = []
+    names = {name for name, _ in targets}
+    for name in sorted(stale):
+        key = f"{application_id}:{name}"
+        if name in names or hashes.get(key) == CLEARED:
+            continue
+        await _clear(tree, name)
+        hashes[key] = CLEARED
+        _save_hashes(state_path, hashes)
+        synced.append(f"{name} (команды сняты)")
+
+    for name, guild in targets:
+        key = f"{application_id}:{name}"
+        current = tree_hash(tree, guild=guild)
+        if not force and hashes.get(key) == current:
+            continue
+        await tree.sync(guild=guild)
+        hashes[key] = current
+        _save_hashes(state_path, hashes)
+        synced.append(name)
+    return synced
@@ -0,0 +1,107 @@
+import os
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+from metrics import db_errors, db_query_seconds
+
+_pool = None
+
+
+def mysql_config():
+    """Параметры подключения из переменных окружения MYSQL_*"""
+    return dict(
+        host=os.getenv("MYSQL_HOST"),
+        port=int(os.getenv("MYSQL_PORT", 3306)),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        db=os.getenv("MYSQL_DATABASE"),
+    )
+
+
+async def init_pool():
+    """Создаёт общий пул соединений (один раз на процесс)"""
+    global _pool
+    if _pool is not None:
+        return _pool
+
+    _pool = await aiomysql.create_pool(
+        minsize=int(os.getenv("MYSQL_POOL_MIN", 1)),
+        maxsize=int(os.getenv("MYSQL_POOL_MAX", 10)),
+        # соединения, простоявшие без дела дольше этого времени, закрываются
+        pool_recycle=int(os.getenv("MYSQL_POOL_IDLE_SECONDS", 300)),
+        # чтения не должны держать открытую транзакцию в пуле
+        autocommit=True,
+        **mysql_config(),
+    )
+    print(f"[MySQL] Пул соединений создан (max={_pool.maxsize})")
+    return _pool
+
+
+async def close_pool():
+    """Закрывает пул и дожидается закрытия всех соединений"""
+    global _pool
+    if _pool is None:
+        return
+    _pool.close()
+    await _pool.wait_closed()
+    _pool = None
+    print("[MySQL] Пул соединений закрыт")
+
+
+@asynccontextmanager
+async def _measured(kind):
+    try:
+        with db_query_seconds.time(kind=kind):
+            yield
+    except (aiomysql.Error, OSError):
+        db_errors.inc(kind=kind)
+        raise
+
+
+@asynccontextmanager
+async def connection():
+    """Берёт соединение из пула с проверкой, что оно живое"""
+    pool = await init_pool()
+    async with pool.acquire() as conn:
+        # health check: переподключается, если сервер закрыл соединение
+        await conn.ping(reconnect=True)
+        yield conn
+
+
+async def fetchone(query, args=None, dictionary=False):
+    async with _measured("fetchone"), connection() as conn:
+        cursor_class = aiomysql.DictCursor if dictionary else aiomysql.Cursor
+        async with conn.cursor(cursor_class) as cursor:
+            await cursor.execute(query, args)
+            return await cursor.fetchone()
+
+
+async def fetchall(query, args=None, dictionary=False):
+    async with _measured("fetchall"), connection() as conn:
+        cursor_class = aiomysql.DictCursor if dictionary else aiomysql.Cursor
+        async with conn.cursor(cursor_class) as cursor:
+            await cursor.execute(query, args)
+            return await cursor.fetchall()
+
+
+@asynccontextmanager
+async def transaction():
+    """Курсор внутри явной транзакции: commit при успехе, иначе rollback"""
+    async with _measured("transaction"), connection() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cursor:
+                yield cursor
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+
+
+async def execute(query, args=None):
+    """Выполняет один запрос, возвращает lastrowid"""
+    async with _measured("execute"), connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, args)
+            return cursor.lastrowid
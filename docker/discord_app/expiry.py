@@ -0,0 +1,99 @@
+import asyncio
+import heapq
+from datetime import datetime
+
+
+class ExpiryScheduler:
+    """Снимает блокировки точно в момент expires_at.
+
+    Дедлайны хранятся в min-куче, цикл спит ровно до ближайшего из них.
+    Истёкшие блокировки снимаются параллельно, не больше concurrency
+    разом. Периодическая сверка с БД подхватывает всё, что могло быть
+    пропущено (перезапуск, ручные правки в таблице).
+    """
+
+    def __init__(
+        self, load_pending, on_expire, sweep_interval=600, concurrency=50
+    ):
+        # load_pending() -> [(key, expires_at), ...]
+        # on_expire(key, expires_at) снимает блокировку
+        self._load_pending = load_pending
+        self._on_expire = on_expire
+        self._sweep_interval = sweep_interval
+        self._heap = []
+        self._deadlines = {}
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key, expires_at):
+        if self._deadlines.get(key) == expires_at:
+            return
+        self._deadlines[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+        self._wakeup.set()
+
+    def cancel(self, key):
+        # запись в куче остаётся и отбрасывается при извлечении
+        self._deadlines.pop(key, None)
+
+    async def recover(self):
+        """Загружает ожидающие истечения из БД"""
+        pending = await self._load_pending()
+        for key, expires_at in pending:
+            self.schedule(key, expires_at)
+        return len(pending)
+
+    def _next_deadline(self):
+        while self._heap:
+            expires_at, key = self._heap[0]
+            if self._deadlines.get(key) == expires_at:
+                return expires_at
+            heapq.heappop(self._heap)
+        return None
+
+    async def _sleep_until(self, deadline):
+        self._wakeup.clear()
+        if deadline is None:
+            timeout = None
+        else:
+            timeout = (deadline - datetime.utcnow()).total_seconds()
+            if timeout <= 0:
+                return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        while True:
+            deadline = self._next_deadline()
+            if deadline is None or deadline > datetime.utcnow():
+                await self._sleep_until(deadline)
+                continue
+
+            expires_at, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            await self._slots.acquire()
+            task = asyncio.create_task(self._expire(key, expires_at))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _expire(self, key, expires_at):
+        try:
+            await self._on_expire(key, expires_at)
+        except Exception as e:
+            print(f"[AutoUnlock] Ошибка при снятии блокировки {key}: {e}")
+        finally:
+            self._slots.release()
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(self._sweep_interval)
+            try:
+                await self.recover()
+            except Exception as e:
+                print(f"[AutoUnlock] Ошибка при сверке с БД: {e}")
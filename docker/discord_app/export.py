@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import aiomysql
+from dotenv import load_dotenv
+
+import db
+from history import HistoryFilter
+from retention import ARCHIVE_TABLE
+
+COLUMNS = (
+    "id",
+    "guild_id",
+    "action",
+    "moderator_id",
+    "moderator_name",
+    "user_id",
+    "user_name",
+    "scope",
+    "reason",
+    "amount",
+    "unit",
+    "created_at",
+    "expires_at",
+    "resolved",
+)
+
+FORMATS = ("csv", "jsonl")
+
+CHUNK_SIZE = 1000
+
+
+class ExportResult:
+    def __init__(self, path, rows=0, elapsed=0.0):
+        self.path = path
+        self.rows = rows
+        self.elapsed = elapsed
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+class _GzipWriter:
+    """Сжатый CSV или JSONL; пишется порциями из отдельного потока"""
+
+    def __init__(self, path, fmt):
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self._fmt = fmt
+        if fmt == "csv":
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(COLUMNS)
+
+    def write(self, rows):
+        if self._fmt == "csv":
+            self._csv.writerows(
+                [_value(value) for value in row] for row in rows
+            )
+            return
+        buffer = io.StringIO()
+        for row in rows:
+            record = {
+                column: _value(value) for column, value in zip(COLUMNS, row)
+            }
+            buffer.write(json.dumps(record, ensure_ascii=False))
+            buffer.write("\n")
+        self._file.write(buffer.getvalue())
+
+    def close(self):
+        self._file.close()
+
+
+async def export_logs(
+    filters, path, fmt="csv", chunk_size=CHUNK_SIZE, table="moderation_logs"
+):
+    """Выгружает записи журнала по filters в сжатый файл path.
+
+    Строки читаются курсором на стороне сервера порциями по chunk_size,
+    поэтому память не растёт с размером выгрузки. Сжатие и запись на
+    диск идут в отдельном потоке и не держат цикл событий. Запрос
+    занимает одно соединение пула до конца выгрузки.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"неизвестный формат: {fmt}")
+    started = time.perf_counter()
+    condition, args = filters.sql()
+    query = f"""
+        SELECT {", ".join(COLUMNS)} FROM {table}
+        WHERE {condition}
+        ORDER BY created_at, id
+    """  # nosec B608 — условие и таблица собираются из констант
+
+    loop = asyncio.get_running_loop()
+    writer = await loop.run_in_executor(None, _GzipWriter, path, fmt)
+    result = ExportResult(path)
+    try:
+        async with db.connection() as conn:
+            async with conn.cursor(aiomysql.SSCursor) as cursor:
+                # строки читаются медленнее, чем MySQL готов их отдать
+                await cursor.execute("SET SESSION net_write_timeout = 600")
+                await cursor.execute(query, args)
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    await loop.run_in_executor(None, writer.write, rows)
+                    result.rows += len(rows)
+    finally:
+        await loop.run_in_executor(None, writer.close)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def temp_export_path(fmt):
+    """Путь для временного файла выгрузки; удаляет вызывающий"""
+    descriptor, path = tempfile.mkstemp(
+        prefix="moderation_logs_", suffix=f".{fmt}.gz"
+    )
+    os.close(descriptor)
+    return path
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Выгрузка журнала модерации в сжатый CSV или JSONL"
+    )
+    parser.add_argument("--guild", type=int, help="только этот сервер")
+    parser.add_argument("--user", type=int, help="только этот пользователь")
+    parser.add_argument("--scope", choices=("channel", "server", "voice"))
+    parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="с даты включительно (UTC), например 2024-05-01",
+    )
+    parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="до даты, не включая (UTC)",
+    )
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help=f"выгрузить архив ({ARCHIVE_TABLE})",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--output", help="файл выгрузки; по умолчанию в текущем каталоге"
+    )
+    args = parser.parse_args()
+
+    output = args.output or (
+        f"moderation_logs_{datetime.utcnow():%Y-%m-%d_%H-%M-%S}"
+        f".{args.format}.gz"
+    )
+    filters = HistoryFilter(
+        args.guild,
+        user_id=args.user,
+        scope=args.scope,
+        since=args.since,
+        until=args.until,
+    )
+    try:
+        result = await export_logs(
+            filters,
+            output,
+            args.format,
+            args.chunk_size,
+            table=ARCHIVE_TABLE if args.archive else "moderation_logs",
+        )
+        print(
+            f"[Export] Выгружено записей: {result.rows} в {result.path} "
+            f"({result.size // 1024} КБ) за {result.elapsed:.1f} с"
+        )
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+import os
+import resource
+import time
+from collections import OrderedDict
+
+import discord
+
+
+def resident_memory():
+    """Текущий RSS процесса в байтах"""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # не Linux — хотя бы пиковое значение
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class GatewayProfile:
+    """Что бот получает от шлюза Discord и что держит в памяти.
+
+    full — как раньше: кэшируются все участники и последние сообщения.
+    lean — в кэше только бот и участники в голосовых каналах (для
+    блокировки голоса), сообщения не кэшируются, intents включаются по
+    нужным функциям. Функции VOICE_LOCKS, MEMBER_SCAN и
+    CLEAR_CONTENT_FILTER в lean по умолчанию выключены — без них бот не
+    запрашивает привилегированные intents members и message_content.
+    Остальных участников бот берёт из данных команды или запрашивает
+    через API (MemberLRU).
+    """
+
+    def __init__(
+        self,
+        lean=False,
+        voice_locks=True,
+        member_scan=True,
+        content_filter=True,
+        max_messages=1000,
+    ):
+        self.lean = lean
+        # блокировка голоса: события голосовых каналов
+        self.voice_locks = voice_locks
+        # полный список участников для сверки и массовых команд по роли
+        self.member_scan = member_scan
+        # /clear с фильтром по тексту сообщения
+        self.content_filter = content_filter
+        self.max_messages = max_messages
+
+    @classmethod
+    def from_env(cls):
+        lean = os.getenv("GATEWAY_PROFILE", "full") == "lean"
+        # в lean функции с дополнительными intents включаются явно
+        default = "0" if lean else "1"
+        return cls(
+            lean=lean,
+            voice_locks=os.getenv("VOICE_LOCKS", default) == "1",
+            member_scan=os.getenv("MEMBER_SCAN", default) == "1",
+            content_filter=os.getenv("CLEAR_CONTENT_FILTER", default) == "1",
+            max_messages=int(os.getenv("MAX_MESSAGES", 0 if lean else 1000)),
+        )
+
+    def __str__(self):
+        if not self.lean:
+            return "full"
+        features = [
+            name
+            for name, enabled in (
+                ("voice", self.voice_locks),
+                ("members", self.member_scan),
+                ("content", self.content_filter),
+            )
+            if enabled
+        ]
+        return f"lean ({', '.join(features) or 'без доп. функций'})"
+
+    def intents(self):
+        if not self.lean:
+            intents = discord.Intents.default()
+            intents.members = True
+            intents.message_content = True
+            return intents
+        # без guild_messages шлюз не присылает события о сообщениях;
+        # /clear читает историю каналов через API
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.members = self.member_scan
+        intents.voice_states = self.voice_locks
+        intents.message_content = self.content_filter
+        return intents
+
+    def member_cache_flags(self):
+        if not self.lean:
+            return discord.MemberCacheFlags.from_intents(self.intents())
+        flags = discord.MemberCacheFlags.none()
+        flags.voice = self.voice_locks
+        return flags
+
+    @property
+    def scans_members(self):
+        """Можно ли получить полный список участников сервера"""
+        return not self.lean or self.member_scan
+
+    @property
+    def handles_voice(self):
+        """Видит ли бот, кто в голосовых каналах (блокировка голоса)"""
+        return not self.lean or self.voice_locks
+
+    @property
+    def reads_content(self):
+        """Доступен ли текст сообщений (фильтр /clear contains)"""
+        return not self.lean or self.content_filter
+
+    @property
+    def message_cache(self):
+        # discord.py заменяет 0 на 1000; кэш отключает None
+        return self.max_messages or None
+
+
+class MemberLRU:
+    """Участники, запрошенные через API, когда их нет в кэше discord.py.
+
+    Хранятся недолго: об изменениях участников вне кэша шлюз бота не
+    уведомляет. Запись нужно сбросить через forget(), когда бот сам
+    меняет участника. None — участника нет на сервере, тоже кэшируется.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._members = OrderedDict()
+
+    def __len__(self):
+        return len(self._members)
+
+    async def get(self, guild, user_id):
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+
+        key = (guild.id, user_id)
+        entry = self._members.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self._members.move_to_end(key)
+            return entry[1]
+
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        self._members[key] = (time.monotonic(), member)
+        self._members.move_to_end(key)
+        while len(self._members) > self.max_size:
+            self._members.popitem(last=False)
+        return member
+
+    def forget(self, guild_id, user_id):
+        self._members.pop((guild_id, user_id), None)
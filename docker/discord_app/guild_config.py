@@ -0,0 +1,102 @@
+import db
+
+
+class GuildSettings:
+    def __init__(self, chat_banned_role_id=None, voice_banned_role_id=None):
+        self.chat_banned_role_id = chat_banned_role_id
+        self.voice_banned_role_id = voice_banned_role_id
+
+
+class GuildConfig:
+    """Настройки серверов из guild_settings, закэшированные в памяти.
+
+    Для серверов без строки в таблице (и для NULL-полей) берутся
+    значения по умолчанию из переменных окружения. Найденные объекты
+    Role тоже кэшируются, чтобы не искать их на каждую блокировку.
+    """
+
+    def __init__(self, default_chat_role_id=None, default_voice_role_id=None):
+        self.defaults = GuildSettings(
+            default_chat_role_id, default_voice_role_id
+        )
+        self._settings = {}
+        self._roles = {}
+
+    async def load(self):
+        rows = await db.fetchall(
+            "SELECT guild_id, chat_banned_role_id, voice_banned_role_id "
+            "FROM guild_settings",
+            dictionary=True,
+        )
+        self._settings = {
+            row["guild_id"]: GuildSettings(
+                row["chat_banned_role_id"], row["voice_banned_role_id"]
+            )
+            for row in rows
+        }
+        self._roles.clear()
+        return len(self._settings)
+
+    def get(self, guild_id):
+        settings = self._settings.get(guild_id)
+        if settings is None:
+            return self.defaults
+        return GuildSettings(
+            settings.chat_banned_role_id or self.defaults.chat_banned_role_id,
+            settings.voice_banned_role_id
+            or self.defaults.voice_banned_role_id,
+        )
+
+    def _role(self, guild, role_id):
+        if not role_id:
+            return None
+        key = (guild.id, role_id)
+        role = self._roles.get(key)
+        if role is None:
+            role = guild.get_role(role_id)
+            if role is not None:
+                self._roles[key] = role
+        return role
+
+    def chat_banned_role(self, guild):
+        return self._role(guild, self.get(guild.id).chat_banned_role_id)
+
+    def voice_banned_role(self, guild):
+        return self._role(guild, self.get(guild.id).voice_banned_role_id)
+
+    def invalidate(self, guild_id=None, role_id=None):
+        """Сбрасывает кэш ролей сервера (или одной роли)"""
+        self._roles = {
+            (cached_guild_id, cached_role_id): role
+            for (cached_guild_id, cached_role_id), role in self._roles.items()
+            if cached_guild_id != guild_id
+            or (role_id is not None and cached_role_id != role_id)
+        }
+
+    async def update(self, guild_id, **fields):
+        """Меняет настройки сервера в БД и в кэше"""
+        current = self._settings.get(guild_id, GuildSettings())
+        settings = GuildSettings(
+            fields.get("chat_banned_role_id", current.chat_banned_role_id),
+            fields.get("voice_banned_role_id", current.voice_banned_role_id),
+        )
+        await db.execute(
+            """
+            INSERT INTO guild_settings (
+                guild_id, chat_banned_role_id, voice_banned_role_id,
+                updated_at
+            ) VALUES (%s, %s, %s, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE
+                chat_banned_role_id = VALUES(chat_banned_role_id),
+                voice_banned_role_id = VALUES(voice_banned_role_id),
+                updated_at = VALUES(updated_at)
+            """,
+            (
+                guild_id,
+                settings.chat_banned_role_id,
+                settings.voice_banned_role_id,
+            ),
+        )
+        self._settings[guild_id] = settings
+        self.invalidate(guild_id)
+        return settings
@@ -0,0 +1,169 @@
+import time
+from collections import OrderedDict
+
+import db
+
+PAGE_SIZE = 10
+
+COLUMNS = (
+    "id, action, moderator_id, moderator_name, user_id, user_name, scope, "
+    "reason, amount, unit, created_at, expires_at, resolved"
+)
+
+
+class HistoryFilter:
+    """Условия выборки /history; key() — ключ для кэша страниц"""
+
+    def __init__(
+        self,
+        guild_id,
+        user_id=None,
+        moderator_id=None,
+        scope=None,
+        action=None,
+        since=None,
+        until=None,
+    ):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.moderator_id = moderator_id
+        self.scope = scope
+        self.action = action
+        self.since = since
+        self.until = until
+
+    def key(self):
+        return (
+            self.guild_id,
+            self.user_id,
+            self.moderator_id,
+            self.scope,
+            self.action,
+            self.since,
+            self.until,
+        )
+
+    def sql(self):
+        """Условие WHERE и параметры без учёта позиции страницы.
+
+        guild_id = None — все серверы (выгрузка из консоли).
+        """
+        conditions = []
+        args = []
+        for column, value in (
+            ("guild_id", self.guild_id),
+            ("user_id", self.user_id),
+            ("moderator_id", self.moderator_id),
+            ("scope", self.scope),
+            ("action", self.action),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = %s")
+                args.append(value)
+        if self.since is not None:
+            conditions.append("created_at >= %s")
+            args.append(self.since)
+        if self.until is not None:
+            conditions.append("created_at < %s")
+            args.append(self.until)
+        return " AND ".join(conditions) or "TRUE", args
+
+
+async def fetch_page(filters, cursor=None, page_size=PAGE_SIZE):
+    """Страница журнала от новых записей к старым.
+
+    cursor — (created_at, id) последней записи предыдущей страницы.
+    Возвращает (rows, has_more).
+    """
+    condition, args = filters.sql()
+    if cursor is not None:
+        created_at, row_id = cursor
+        # раскрытое (created_at, id) < (%s, %s): так MySQL берёт диапазон
+        # по индексу, а не фильтрует строки после чтения
+        condition += " AND created_at <= %s AND (created_at < %s OR id < %s)"
+        args += [created_at, created_at, row_id]
+    query = f"""
+        SELECT {COLUMNS} FROM moderation_logs
+        WHERE {condition}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """  # nosec B608 — условие собирается из констант
+    rows = await db.fetchall(query, [*args, page_size + 1], dictionary=True)
+    return rows[:page_size], len(rows) > page_size
+
+
+class PageCache:
+    """Недавно просмотренные страницы: LRU с коротким сроком жизни.
+
+    Срок жизни ограничивает, насколько устаревшими могут быть первые
+    страницы, куда попадают новые записи.
+    """
+
+    def __init__(self, max_pages=256, ttl=60):
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self._pages = OrderedDict()
+
+    def get(self, key):
+        entry = self._pages.get(key)
+        if entry is None:
+            return None
+        stored_at, page = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._pages[key]
+            return None
+        self._pages.move_to_end(key)
+        return page
+
+    def put(self, key, page):
+        self._pages[key] = (time.monotonic(), page)
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+
+    def invalidate(self, guild_id):
+        for key in [key for key in self._pages if key[0][0] == guild_id]:
+            del self._pages[key]
+
+
+class HistoryPager:
+    """Постраничный просмотр с кэшем; позиции страниц хранятся стеком"""
+
+    def __init__(self, filters, cache, page_size=PAGE_SIZE):
+        self.filters = filters
+        self.cache = cache
+        self.page_size = page_size
+        self.cursors = [None]  # начало каждой уже открытой страницы
+        self.rows = []
+        self.has_more = False
+
+    @property
+    def page(self):
+        return len(self.cursors)
+
+    async def _load(self):
+        key = (self.filters.key(), self.cursors[-1], self.page_size)
+        page = self.cache.get(key)
+        if page is None:
+            page = await fetch_page(
+                self.filters, self.cursors[-1], self.page_size
+            )
+            self.cache.put(key, page)
+        self.rows, self.has_more = page
+
+    async def first(self):
+        self.cursors = [None]
+        await self._load()
+
+    async def next(self):
+        if not self.has_more:
+            return
+        last = self.rows[-1]
+        self.cursors.append((last["created_at"], last["id"]))
+        await self._load()
+
+    async def previous(self):
+        if len(self.cursors) == 1:
+            return
+        self.cursors.pop()
+        await self._load()
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+
+class LockState:
+    """Активные блокировки в памяти.
+
+    (guild_id, user_id) -> {scope: expires_at}; expires_at = None —
+    бессрочно. Все области пользователя достаются одним обращением.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._locks = {}
+        # растёт при каждом изменении — чтобы сверка с БД не затёрла
+        # изменения, сделанные пока шёл запрос
+        self.generation = 0
+
+    def __len__(self):
+        return sum(len(scopes) for scopes in self._locks.values())
+
+    def add(self, guild_id, user_id, scope, expires_at=None):
+        self._locks.setdefault((guild_id, user_id), {})[scope] = expires_at
+        self.generation += 1
+
+    def remove(self, guild_id, user_id, scope):
+        scopes = self._locks.get((guild_id, user_id))
+        if scopes is None:
+            return
+        scopes.pop(scope, None)
+        if not scopes:
+            del self._locks[(guild_id, user_id)]
+        self.generation += 1
+
+    def active_scopes(self, guild_id, user_id, now=None):
+        """Области, в которых пользователь сейчас заблокирован"""
+        scopes = self._locks.get((guild_id, user_id))
+        if not scopes:
+            return set()
+        now = now or datetime.utcnow()
+        return {
+            scope
+            for scope, expires_at in scopes.items()
+            if expires_at is None or expires_at > now
+        }
+
+    def expires_at(self, guild_id, user_id, scope, default=None):
+        """Срок блокировки; default — если такой блокировки нет"""
+        return self._locks.get((guild_id, user_id), {}).get(scope, default)
+
+    def is_locked(self, guild_id, user_id, scope):
+        return scope in self.active_scopes(guild_id, user_id)
+
+    def guild_locks(self, guild_id):
+        """{user_id: {scope: expires_at}} всех блокировок сервера"""
+        return {
+            user_id: dict(scopes)
+            for (lock_guild_id, user_id), scopes in self._locks.items()
+            if lock_guild_id == guild_id
+        }
+
+    def replace(self, entries):
+        """Полностью заменяет состояние.
+
+        entries — [(guild_id, user_id, scope, expires_at)]
+        """
+        locks = {}
+        for guild_id, user_id, scope, expires_at in entries:
+            scopes = locks.setdefault((guild_id, user_id), {})
+            if scope in scopes and scopes[scope] is None:
+                continue
+            if expires_at is None or scope not in scopes:
+                scopes[scope] = expires_at
+            else:
+                scopes[scope] = max(scopes[scope], expires_at)
+        self._locks = locks
+        self.loaded = True
+        self.generation += 1
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    inner = ",".join(
+        f'{name}="{str(value)}"' for name, value in sorted(labels.items())
+    )
+    return "{" + inner + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} counter",
+        ]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels_text(dict(key))} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        counts, total = self._values.get(
+            key, ([0] * (len(self.buckets) + 1), 0.0)
+        )
+        counts[bisect_left(self.buckets, value)] += 1
+        self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for key, (counts, total) in self._values.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = _labels_text({**labels, "le": bound})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            suffix = _labels_text(labels)
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self.register(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+command_latency = registry.histogram(
+    "funzone_command_seconds",
+    "Время от создания взаимодействия до завершения команды",
+)
+command_errors = registry.counter(
+    "funzone_command_errors_total", "Команды, завершившиеся ошибкой"
+)
+db_query_seconds = registry.histogram(
+    "funzone_db_query_seconds", "Длительность запросов к MySQL"
+)
+db_errors = registry.counter(
+    "funzone_db_errors_total", "Ошибки запросов к MySQL"
+)
+expiry_lag_seconds = registry.histogram(
+    "funzone_expiry_lag_seconds",
+    "Задержка автоматической разблокировки относительно expires_at",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 3600),
+)
+purged_messages = registry.counter(
+    "funzone_purged_messages_total", "Удалённые /clear сообщения"
+)
+purge_rate = registry.gauge(
+    "funzone_purge_messages_per_second",
+    "Скорость удаления в последней задаче /clear",
+)
+rate_limit_hits = registry.counter(
+    "funzone_discord_rate_limits_total", "Ответы 429 от Discord"
+)
+event_loop_lag = registry.histogram(
+    "funzone_event_loop_lag_seconds",
+    "Опоздание цикла событий относительно запланированного пробуждения",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+audit_pending = registry.gauge(
+    "funzone_audit_outbox_pending", "Операции журнала, ждущие записи в MySQL"
+)
+active_locks = registry.gauge(
+    "funzone_active_locks", "Активные блокировки в памяти"
+)
+action_queue = registry.gauge(
+    "funzone_action_queue", "Участники, ждущие изменения ролей или таймаута"
+)
+action_retries = registry.counter(
+    "funzone_action_retries_total",
+    "Повторы изменений ролей и таймаутов после временных ошибок",
+)
+resident_memory = registry.gauge(
+    "funzone_resident_memory_bytes", "Резидентная память процесса"
+)
+cached_members = registry.gauge(
+    "funzone_cached_members", "Участники в кэше discord.py и в MemberLRU"
+)
+cached_messages = registry.gauge(
+    "funzone_cached_messages", "Сообщения в кэше discord.py"
+)
+
+
+class RateLimitCounter(logging.Handler):
+    """Считает сообщения discord.http о лимитах запросов"""
+
+    def emit(self, record):
+        if "responded with 429" in record.getMessage():
+            rate_limit_hits.inc()
+
+
+def install_rate_limit_counter():
+    logging.getLogger("discord.http").addHandler(RateLimitCounter())
+
+
+async def watch_event_loop(interval=0.5):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(
+            max(0.0, time.perf_counter() - started - interval)
+        )
+
+
+async def _handle(reader, writer, collect):
+    try:
+        request_line = await reader.readline()
+        # заголовки не нужны, но их надо дочитать
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+            if collect:
+                collect()
+            body = registry.render().encode("utf-8")
+            status = "200 OK"
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+            content_type = "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode(
+                "latin-1"
+            )
+            + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host, port, collect=None):
+    """HTTP-сервер с одним адресом /metrics; collect() — перед ответом"""
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle(reader, writer, collect), host, port
+    )
+    print(f"[Metrics] Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import os
+import re
+
+from aiomysql import Error
+from dotenv import load_dotenv
+
+import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# Ошибки, которые означают «уже сделано» — схема могла быть создана
+# вручную до появления миграций
+ALREADY_APPLIED_ERRORS = {
+    1050,  # Table already exists
+    1060,  # Duplicate column name
+    1061,  # Duplicate key name
+    1091,  # Can't DROP; check that column/key exists
+}
+
+# Горячие запросы и индексы, которые они обязаны использовать
+HOT_QUERIES = [
+    (
+        "has_scope_lock",
+        """
+        SELECT COUNT(*) FROM moderation_logs
+        WHERE guild_id = 1 AND user_id = 1 AND scope = 'channel'
+        AND action = 'lock' AND resolved = FALSE
+        """,
+        {"idx_guild_lock_lookup"},
+    ),
+    (
+        "expiry_sweep",
+        """
+        SELECT guild_id, user_id, scope, MIN(created_at), MIN(expires_at)
+        FROM moderation_logs
+        WHERE action = 'lock' AND scope IN ('channel', 'server', 'voice')
+        AND resolved = FALSE
+        AND (expires_at IS NOT NULL OR scope = 'server')
+        GROUP BY guild_id, user_id, scope
+        """,
+        {"idx_expiry"},
+    ),
+    (
+        "history_user_page",
+        """
+        SELECT id FROM moderation_logs
+        WHERE guild_id = 1 AND user_id = 1
+        AND created_at <= '2024-01-01'
+        AND (created_at < '2024-01-01' OR id < 1)
+        ORDER BY created_at DESC, id DESC
+        LIMIT 11
+        """,
+        {"idx_history_user"},
+    ),
+    (
+        "export_guild",
+        """
+        SELECT id FROM moderation_logs
+        WHERE guild_id = 1 AND created_at >= '2024-01-01'
+        ORDER BY created_at, id
+        """,
+        {"idx_history_guild"},
+    ),
+    (
+        "stats_top_moderators",
+        """
+        SELECT moderator_name, locks FROM stats_moderators
+        WHERE guild_id = 1 ORDER BY locks DESC LIMIT 10
+        """,
+        {"idx_stats_moderators_locks", "PRIMARY"},
+    ),
+]
+
+
+def list_migrations():
+    """[(version, name, path), ...] по возрастанию версии"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", filename)
+        if match:
+            migrations.append(
+                (
+                    int(match.group(1)),
+                    match.group(2),
+                    os.path.join(MIGRATIONS_DIR, filename),
+                )
+            )
+    return migrations
+
+
+def split_statements(sql):
+    return [part.strip() for part in sql.split(";") if part.strip()]
+
+
+async def applied_versions(cursor):
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """)
+    await cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in await cursor.fetchall()}
+
+
+async def migrate():
+    """Применяет недостающие миграции, возвращает список применённых"""
+    applied = []
+    async with db.connection() as conn:
+        async with conn.cursor() as cursor:
+            # несколько процессов (шарды) могут стартовать одновременно
+            await cursor.execute("SELECT GET_LOCK('funzone_migrations', 60)")
+            try:
+                done = await applied_versions(cursor)
+                for version, name, path in list_migrations():
+                    if version in done:
+                        continue
+                    with open(path, "r", encoding="utf-8") as file:
+                        statements = split_statements(file.read())
+                    for statement in statements:
+                        try:
+                            await cursor.execute(statement)
+                        except Error as e:
+                            if e.args[0] not in ALREADY_APPLIED_ERRORS:
+                                raise
+                    await cursor.execute(
+                        "INSERT INTO schema_migrations (version, name, "
+                        "applied_at) VALUES (%s, %s, UTC_TIMESTAMP())",
+                        (version, name),
+                    )
+                    applied.append(version)
+                    print(f"[Migrate] Применена миграция {version}_{name}")
+            finally:
+                await cursor.execute(
+                    "SELECT RELEASE_LOCK('funzone_migrations')"
+                )
+    return applied
+
+
+async def explain_hot_queries():
+    """Проверяет через EXPLAIN, что горячие запросы используют индексы"""
+    ok = True
+    for name, query, expected in HOT_QUERIES:
+        rows = await db.fetchall("EXPLAIN " + query, dictionary=True)
+        used = {row["key"] for row in rows if row["key"]}
+        if used & expected:
+            print(f"[Migrate] {name}: индекс {', '.join(sorted(used))}")
+        else:
+            ok = False
+            plan = ", ".join(
+                f"type={row['type']} key={row['key']}" for row in rows
+            )
+            print(f"[Migrate] {name}: индекс не используется ({plan})")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="проверить планы горячих запросов после миграции",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    try:
+        await migrate()
+        ok = await explain_hot_queries() if args.explain else True
+    finally:
+        await db.close_pool()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,25 @@
+-- Журнал модерации. IF NOT EXISTS — таблица могла быть создана вручную.
+CREATE TABLE IF NOT EXISTS moderation_logs (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+    action VARCHAR(16) NOT NULL,
+    moderator_id BIGINT UNSIGNED NOT NULL,
+    moderator_name VARCHAR(255) NOT NULL,
+    user_id BIGINT UNSIGNED NOT NULL,
+    user_name VARCHAR(255) NOT NULL,
+    scope VARCHAR(16) NOT NULL,
+    reason TEXT,
+    amount INT NULL,
+    unit VARCHAR(16) NULL,
+    created_at DATETIME NOT NULL,
+    expires_at DATETIME NULL,
+    resolved BOOLEAN NULL,
+    PRIMARY KEY (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- has_scope_lock: user_id + scope + action + resolved/expires_at
+CREATE INDEX idx_lock_lookup
+    ON moderation_logs (user_id, scope, action, resolved, expires_at);
+
+-- выборка истекающих блокировок: action + scope + resolved + expires_at
+CREATE INDEX idx_expiry
+    ON moderation_logs (action, scope, resolved, expires_at);
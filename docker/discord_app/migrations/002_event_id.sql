@@ -0,0 +1,4 @@
+-- Ключ идемпотентности: повторная доставка события из outbox не создаёт дубль
+ALTER TABLE moderation_logs ADD COLUMN event_id CHAR(32) NULL AFTER id;
+
+CREATE UNIQUE INDEX uq_event_id ON moderation_logs (event_id);
@@ -0,0 +1,19 @@
+-- Сервер, к которому относится запись. 0 — записи, сделанные до поддержки
+-- нескольких серверов; при старте бот относит их к GUILD_ID.
+ALTER TABLE moderation_logs
+    ADD COLUMN guild_id BIGINT UNSIGNED NOT NULL DEFAULT 0 AFTER event_id;
+
+-- проверка блокировки теперь всегда в пределах сервера
+CREATE INDEX idx_guild_lock_lookup
+    ON moderation_logs (guild_id, user_id, scope, action, resolved, expires_at);
+
+DROP INDEX idx_lock_lookup ON moderation_logs;
+
+-- Настройки серверов; NULL — взять значение из переменных окружения
+CREATE TABLE IF NOT EXISTS guild_settings (
+    guild_id BIGINT UNSIGNED NOT NULL,
+    chat_banned_role_id BIGINT UNSIGNED NULL,
+    voice_banned_role_id BIGINT UNSIGNED NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (guild_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
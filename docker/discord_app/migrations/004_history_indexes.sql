@@ -0,0 +1,10 @@
+-- /history листает журнал по ключу (created_at, id) от новых к старым;
+-- индексы дают сразу нужную страницу без сортировки и OFFSET
+CREATE INDEX idx_history_guild
+    ON moderation_logs (guild_id, created_at, id);
+
+CREATE INDEX idx_history_user
+    ON moderation_logs (guild_id, user_id, created_at, id);
+
+CREATE INDEX idx_history_moderator
+    ON moderation_logs (guild_id, moderator_id, created_at, id);
@@ -0,0 +1,8 @@
+-- Архив завершённых записей журнала (retention.py). Та же структура, что
+-- у moderation_logs, но без индексов для проверки активных блокировок —
+-- в архиве активных блокировок нет
+CREATE TABLE IF NOT EXISTS moderation_logs_archive LIKE moderation_logs;
+
+DROP INDEX idx_guild_lock_lookup ON moderation_logs_archive;
+
+DROP INDEX idx_expiry ON moderation_logs_archive;
@@ -0,0 +1,27 @@
+-- Блокировки на сервере теперь тоже снимает планировщик и помечает
+-- resolved, как блокировки в канале. Проверки идут по resolved, а не по
+-- сравнению expires_at с текущим временем.
+
+-- «Максимальные» блокировки до этой миграции на деле длились 28 дней —
+-- столько держится таймаут Discord. Бессрочными они становятся только
+-- для новых записей
+UPDATE moderation_logs
+SET expires_at = DATE_ADD(created_at, INTERVAL 28 DAY)
+WHERE action = 'lock' AND scope = 'server' AND resolved IS NULL
+AND expires_at IS NULL;
+
+UPDATE moderation_logs
+SET resolved = (expires_at <= UTC_TIMESTAMP())
+WHERE action = 'lock' AND scope = 'server' AND resolved IS NULL;
+
+-- снятые командой /unlock раньше срока
+UPDATE moderation_logs AS locks
+JOIN moderation_logs AS unlocks
+    ON unlocks.guild_id = locks.guild_id
+    AND unlocks.user_id = locks.user_id
+    AND unlocks.scope = 'server'
+    AND unlocks.action = 'unlock'
+    AND unlocks.created_at >= locks.created_at
+SET locks.resolved = TRUE
+WHERE locks.action = 'lock' AND locks.scope = 'server'
+AND locks.resolved = FALSE;
@@ -0,0 +1,42 @@
+-- Агрегаты для панели статистики (stats.py). Обновляются вместе с записью
+-- журнала в той же транзакции, панель читает только их — без GROUP BY по
+-- всему moderation_logs. Заполняются по накопленному журналу при первом
+-- запуске бота (stats.ensure_built).
+
+-- события по дням: action + scope
+CREATE TABLE IF NOT EXISTS stats_daily (
+    guild_id BIGINT UNSIGNED NOT NULL,
+    day DATE NOT NULL,
+    action VARCHAR(16) NOT NULL,
+    scope VARCHAR(16) NOT NULL,
+    events INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, day, action, scope)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- события за всё время по областям
+CREATE TABLE IF NOT EXISTS stats_scopes (
+    guild_id BIGINT UNSIGNED NOT NULL,
+    action VARCHAR(16) NOT NULL,
+    scope VARCHAR(16) NOT NULL,
+    events INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, action, scope)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS stats_moderators (
+    guild_id BIGINT UNSIGNED NOT NULL,
+    moderator_id BIGINT UNSIGNED NOT NULL,
+    moderator_name VARCHAR(255) NOT NULL,
+    locks INT UNSIGNED NOT NULL DEFAULT 0,
+    unlocks INT UNSIGNED NOT NULL DEFAULT 0,
+    last_action_at DATETIME NOT NULL,
+    PRIMARY KEY (guild_id, moderator_id),
+    INDEX idx_stats_moderators_locks (guild_id, locks)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- активные блокировки сейчас: +1 при блокировке, −N при снятии
+CREATE TABLE IF NOT EXISTS stats_active_locks (
+    guild_id BIGINT UNSIGNED NOT NULL,
+    scope VARCHAR(16) NOT NULL,
+    active INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, scope)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
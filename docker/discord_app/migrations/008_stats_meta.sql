@@ -0,0 +1,7 @@
+-- Отметка о полном пересчёте агрегатов (stats.rebuild). По пустоте самих
+-- таблиц stats_* это не понять: сброс журнала, пришедший раньше первого
+-- пересчёта, уже добавляет в них строки.
+CREATE TABLE IF NOT EXISTS stats_meta (
+    name VARCHAR(64) NOT NULL PRIMARY KEY,
+    updated_at DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
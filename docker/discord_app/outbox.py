@@ -0,0 +1,60 @@
+import json
+import os
+import sqlite3
+
+
+class Outbox:
+    """Локальный журнал операций (SQLite), переживает недоступность MySQL.
+
+    Операция сначала пишется сюда и только потом переносится в MySQL.
+    Методы синхронные — вызывать из одного выделенного потока.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def append(self, kind, args):
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (kind, payload) VALUES (?, ?)",
+                (kind, json.dumps(args, default=str)),
+            )
+        return cursor.lastrowid
+
+    def append_many(self, ops):
+        """ops — [(kind, args)]; все записи одной транзакцией"""
+        seqs = []
+        with self._conn:
+            for kind, args in ops:
+                cursor = self._conn.execute(
+                    "INSERT INTO outbox (kind, payload) VALUES (?, ?)",
+                    (kind, json.dumps(args, default=str)),
+                )
+                seqs.append(cursor.lastrowid)
+        return seqs
+
+    def load(self):
+        """Все неперенесённые операции по порядку: [(seq, kind, args)]"""
+        rows = self._conn.execute(
+            "SELECT seq, kind, payload FROM outbox ORDER BY seq"
+        ).fetchall()
+        return [(seq, kind, tuple(json.loads(p))) for seq, kind, p in rows]
+
+    def delete_upto(self, seq):
+        with self._conn:
+            self._conn.execute("DELETE FROM outbox WHERE seq <= ?", (seq,))
+
+    def close(self):
+        self._conn.close()
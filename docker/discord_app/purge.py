@@ -0,0 +1,168 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import discord
+
+# Discord не даёт удалять пачкой сообщения старше 14 дней; берём с запасом,
+# чтобы сообщение не «состарилось» между чтением истории и удалением
+BULK_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+BULK_SIZE = 100
+
+
+class PurgeJob:
+    """Потоковая очистка канала.
+
+    История читается от новых к старым. Сообщения моложе 14 дней
+    удаляются пачками по 100, более старые — по одному с учётом лимитов.
+    Позиция запоминается, поэтому остановленную задачу можно продолжить.
+    """
+
+    def __init__(
+        self,
+        channel,
+        limit,
+        author=None,
+        contains=None,
+        before=None,
+        after=None,
+        on_progress=None,
+        progress_interval=2.0,
+    ):
+        self.channel = channel
+        self.limit = limit
+        self.author = author
+        self.contains = contains.lower() if contains else None
+        self.after = after
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+
+        self.position = before  # до какого сообщения уже всё обработано
+        self.scanned = 0
+        self.deleted = 0
+        self.rate_limited = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self.cancelled = False
+        self.done = False
+        self.running = False
+        self.error = None
+        self._last_report = 0.0
+
+    @property
+    def rate(self):
+        """Удалено сообщений в секунду"""
+        return self.deleted / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def resumable(self):
+        """Остановлена или прервана ошибкой — можно продолжить"""
+        return not self.running and not self.done
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _matches(self, message):
+        if self.author and message.author.id != self.author.id:
+            return False
+        if self.contains and self.contains not in message.content.lower():
+            return False
+        return True
+
+    async def _report(self, force=False):
+        now = time.monotonic()
+        self.elapsed += now - self.started_at
+        self.started_at = now
+        if not self.on_progress:
+            return
+        if force or now - self._last_report >= self.progress_interval:
+            self._last_report = now
+            try:
+                await self.on_progress(self)
+            except discord.HTTPException:
+                # токен взаимодействия живёт 15 минут — дальше молча
+                pass
+
+    async def _delete_one(self, message):
+        while True:
+            try:
+                await message.delete()
+                return True
+            except discord.NotFound:
+                return False
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    raise
+                self.rate_limited += 1
+                retry_after = getattr(e, "retry_after", None) or 1.0
+                await asyncio.sleep(retry_after)
+
+    async def _delete_bulk(self, messages):
+        if len(messages) == 1:
+            self.deleted += await self._delete_one(messages[0])
+            return
+        try:
+            await self.channel.delete_messages(messages)
+            self.deleted += len(messages)
+        except discord.HTTPException:
+            # часть сообщений успела устареть или уже удалена
+            for message in messages:
+                self.deleted += await self._delete_one(message)
+
+    def _remaining(self):
+        return self.limit - self.deleted
+
+    async def run(self):
+        """Работает до конца истории, лимита или отмены"""
+        self.cancelled = False
+        self.done = False
+        self.running = True
+        self.error = None
+        self.started_at = time.monotonic()
+        bulk = []
+        # position сдвигается только когда всё до этого сообщения удалено:
+        # пока в bulk ждут сообщения, пропущенные после них не считаются
+        # обработанными — при ошибке продолжение начнётся с bulk
+        last = None
+        try:
+            async for message in self.channel.history(
+                limit=None,
+                before=self.position,
+                after=self.after,
+                oldest_first=False,
+            ):
+                if self.cancelled or len(bulk) >= self._remaining():
+                    break
+                self.scanned += 1
+                last = message
+                if not self._matches(message):
+                    if not bulk:
+                        self.position = message
+                    continue
+
+                young_after = discord.utils.utcnow() - BULK_MAX_AGE
+                if message.created_at > young_after:
+                    bulk.append(message)
+                    if len(bulk) == BULK_SIZE:
+                        await self._delete_bulk(bulk)
+                        self.position = last
+                        bulk = []
+                else:
+                    if bulk:
+                        await self._delete_bulk(bulk)
+                        bulk = []
+                    self.deleted += await self._delete_one(message)
+                    self.position = message
+                await self._report()
+
+            if bulk:
+                await self._delete_bulk(bulk)
+                self.position = last
+        except discord.HTTPException as e:
+            self.error = e
+            print(f"[Purge] Ошибка при очистке канала {self.channel}: {e}")
+        finally:
+            self.running = False
+            self.done = not self.cancelled and self.error is None
+            await self._report(force=True)
+        return self.deleted
@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+
+from timeouts import timeout_until
+
+
+class Drift:
+    """Расхождения между журналом и тем, что участникам выдано в Discord"""
+
+    def __init__(self):
+        self.add_role = []  # [(member, role)] активная блокировка, роли нет
+        self.remove_role = []  # [(member, role)] роль есть, блокировки нет
+        self.reapply_timeout = []  # [(member, until)] таймаут снят раньше
+        self.record_timeout = []  # таймаут выдан в обход бота
+        self.record_role = []  # [(member, scope)] роль выдана в обход бота
+        self.resolve = []  # [(member, scope)] блокировку сняли в Discord
+        # [(member, scope, role)] роли нет: сняли вручную или участник
+        # перезашёл — решает split_missing_roles()
+        self.missing_role = []
+
+    def __len__(self):
+        return (
+            len(self.add_role)
+            + len(self.remove_role)
+            + len(self.reapply_timeout)
+            + len(self.record_timeout)
+            + len(self.record_role)
+            + len(self.resolve)
+            + len(self.missing_role)
+        )
+
+    def summary(self):
+        return (
+            f"выдано ролей: {len(self.add_role)}, "
+            f"снято ролей: {len(self.remove_role)}, "
+            f"возвращено таймаутов: {len(self.reapply_timeout)}, "
+            f"записано таймаутов: {len(self.record_timeout)}, "
+            f"записано ролей: {len(self.record_role)}, "
+            f"снято блокировок: {len(self.resolve)}"
+        )
+
+    def split_missing_roles(self, locked_since):
+        """Разбирает missing_role по времени начала блокировок.
+
+        locked_since — {(user_id, scope): created_at}. Роль, потерянная
+        при выходе с сервера, выдаётся снова — иначе блокировку снимал бы
+        перезаход. Роль, снятую вручную у участника, который с тех пор
+        не выходил, бот не возвращает: блокировка снимается в журнале.
+        """
+        for member, scope, role in self.missing_role:
+            since = locked_since.get((member.id, scope))
+            joined_at = member.joined_at
+            if (
+                since is None
+                or joined_at is None
+                or (joined_at > since.replace(tzinfo=timezone.utc))
+            ):
+                self.add_role.append((member, role))
+            else:
+                self.resolve.append((member, scope))
+        self.missing_role = []
+
+
+def find_drift(members, locks, roles, now=None, skip=(), enforce=False):
+    """Сравнивает участников сервера с активными блокировками из журнала.
+
+    locks — {user_id: {scope: expires_at}} сервера, roles — {scope: role}
+    для блокировок, которые выдаются ролью.
+
+    По умолчанию ручные действия модераторов в Discord не отменяются, а
+    записываются в журнал: роль или таймаут, выданные в обход бота,
+    становятся блокировкой, снятые вручную — снимают блокировку.
+    Отсутствующая роль попадает в missing_role, её разбирает
+    split_missing_roles(). Таймаут, который закончился сам (бот не успел
+    его продлить), возвращается всегда.
+
+    enforce=True — журнал главный: лишняя роль снимается, недостающая
+    роль и снятый таймаут возвращаются. Таймаут без записи в журнале
+    записывается в обоих режимах — у него есть свой срок в Discord.
+
+    Истёкшие блокировки не трогаются — их снимает ExpiryScheduler.
+    skip — id участников, которых сейчас меняет сам бот.
+    """
+    now = now or datetime.utcnow()
+    aware_now = now.replace(tzinfo=timezone.utc)
+    drift = Drift()
+    for member in members:
+        if member.bot or member.id in skip:
+            continue
+        scopes = locks.get(member.id, {})
+
+        for scope, role in roles.items():
+            if role is None:
+                continue
+            has_role = role in member.roles
+            if scope in scopes:
+                expires_at = scopes[scope]
+                active = expires_at is None or expires_at > now
+                if active and not has_role:
+                    if enforce:
+                        drift.add_role.append((member, role))
+                    else:
+                        drift.missing_role.append((member, scope, role))
+            elif has_role:
+                if enforce:
+                    drift.remove_role.append((member, role))
+                else:
+                    drift.record_role.append((member, scope))
+
+        timed_out = (
+            member.timed_out_until is not None
+            and member.timed_out_until > aware_now
+        )
+        if "server" in scopes:
+            expires_at = scopes["server"]
+            active = expires_at is None or expires_at > now
+            # снятый вручную таймаут Discord обнуляет, у закончившегося
+            # остаётся время окончания в прошлом
+            lapsed = member.timed_out_until is not None
+            if active and not timed_out:
+                if lapsed or enforce:
+                    until = timeout_until(expires_at, now)
+                    drift.reapply_timeout.append(
+                        (member, until.replace(tzinfo=timezone.utc))
+                    )
+                else:
+                    drift.resolve.append((member, "server"))
+        elif timed_out:
+            drift.record_timeout.append(member)
+    return drift
@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+import db
+
+ARCHIVE_TABLE = "moderation_logs_archive"
+
+COLUMNS = (
+    "id, event_id, guild_id, action, moderator_id, moderator_name, "
+    "user_id, user_name, scope, reason, amount, unit, created_at, "
+    "expires_at, resolved"
+)
+
+# Записи, которые больше не влияют на проверки блокировок: снятые или
+# истёкшие блокировки и сами разблокировки
+FINISHED = "(action <> 'lock' OR resolved = TRUE)"
+
+
+class RetentionResult:
+    def __init__(self, archived=0, batches=0, elapsed=0.0, finished_at=None):
+        self.archived = archived
+        self.batches = batches
+        self.elapsed = elapsed
+        self.finished_at = finished_at
+
+
+async def _boundary_id(cutoff):
+    """id первой записи не старше cutoff — дальше архивировать нечего.
+
+    id растут вместе с created_at, поэтому поиск идёт по первичному ключу
+    и читает только старую часть таблицы.
+    """
+    row = await db.fetchone(
+        "SELECT id FROM moderation_logs WHERE created_at >= %s "
+        "ORDER BY id LIMIT 1",
+        (cutoff,),
+    )
+    if row:
+        return row[0]
+    row = await db.fetchone(
+        "SELECT COALESCE(MAX(id), 0) + 1 FROM moderation_logs"
+    )
+    return row[0]
+
+
+async def _archive_batch(ids):
+    placeholders = ", ".join(["%s"] * len(ids))
+    async with db.transaction() as cursor:
+        await cursor.execute(
+            f"""
+            INSERT INTO {ARCHIVE_TABLE} ({COLUMNS})
+            SELECT {COLUMNS} FROM moderation_logs WHERE id IN ({placeholders})
+            """,  # nosec B608 — подставляются только плейсхолдеры
+            ids,
+        )
+        await cursor.execute(
+            f"""
+            DELETE FROM moderation_logs WHERE id IN ({placeholders})
+            """,  # nosec B608 — подставляются только плейсхолдеры
+            ids,
+        )
+
+
+async def archive_old_rows(max_age_days, batch_size=500, pause=0.1):
+    """Переносит завершённые записи старше max_age_days в архив.
+
+    Каждая порция — отдельная короткая транзакция по первичному ключу,
+    блокируются только переносимые строки. Между порциями пауза, чтобы
+    не мешать рабочим запросам. None — архивацию сейчас выполняет другой
+    процесс.
+    """
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    result = RetentionResult()
+    async with db.connection() as conn:
+        async with conn.cursor() as cursor:
+            # шарды могут запустить архивацию одновременно
+            await cursor.execute("SELECT GET_LOCK('funzone_retention', 0)")
+            (acquired,) = await cursor.fetchone()
+            if not acquired:
+                return None
+            try:
+                boundary = await _boundary_id(cutoff)
+                last_id = 0
+                while True:
+                    rows = await db.fetchall(
+                        f"""
+                        SELECT id FROM moderation_logs
+                        WHERE id > %s AND id < %s AND created_at < %s
+                        AND {FINISHED}
+                        ORDER BY id LIMIT %s
+                        """,  # nosec B608 — условие из констант
+                        (last_id, boundary, cutoff, batch_size),
+                    )
+                    if not rows:
+                        break
+                    ids = [row[0] for row in rows]
+                    await _archive_batch(ids)
+                    result.archived += len(ids)
+                    result.batches += 1
+                    last_id = ids[-1]
+                    await asyncio.sleep(pause)
+            finally:
+                await cursor.execute(
+                    "SELECT RELEASE_LOCK('funzone_retention')"
+                )
+    result.elapsed = time.perf_counter() - started
+    result.finished_at = datetime.utcnow()
+    return result
+
+
+async def table_stats():
+    """Размер и число строк журнала и архива.
+
+    Число строк — оценка InnoDB; точный COUNT(*) по миллионам строк
+    слишком дорог для команды.
+    """
+    async with db.connection() as conn:
+        async with conn.cursor() as cursor:
+            # иначе MySQL 8 отдаёт статистику, закэшированную на сутки
+            await cursor.execute(
+                "SET SESSION information_schema_stats_expiry = 0"
+            )
+            await cursor.execute(
+                """
+                SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH
+                FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE()
+                AND TABLE_NAME IN ('moderation_logs', %s)
+                """,
+                (ARCHIVE_TABLE,),
+            )
+            return {
+                name: {
+                    "rows": rows or 0,
+                    "data_bytes": data or 0,
+                    "index_bytes": index or 0,
+                }
+                for name, rows, data, index in await cursor.fetchall()
+            }
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Перенос старых записей журнала в архив"
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=int(os.getenv("RETENTION_DAYS", 90)),
+        help="архивировать завершённые записи старше стольких дней",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    try:
+        result = await archive_old_rows(args.days, args.batch_size)
+        if result is None:
+            print("[Retention] Архивация уже выполняется другим процессом")
+        else:
+            print(
+                f"[Retention] Перенесено в архив: {result.archived} "
+                f"за {result.elapsed:.1f} с"
+            )
+        for name, stats in (await table_stats()).items():
+            print(
+                f"[Retention] {name}: ~{stats['rows']} строк, данные "
+                f"{stats['data_bytes'] // 1024} КБ, индексы "
+                f"{stats['index_bytes'] // 1024} КБ"
+            )
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+def parse_shard_ids(value):
+    """'0,1,4-7' -> [0, 1, 4, 5, 6, 7]; пустая строка -> None (все шарды)"""
+    if not value or not value.strip():
+        return None
+    shard_ids = set()
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            shard_ids.update(range(int(start), int(end) + 1))
+        elif part:
+            shard_ids.add(int(part))
+    return sorted(shard_ids)
+
+
+def shard_for(guild_id, shard_count):
+    """Номер шарда, к которому Discord относит сервер"""
+    return (guild_id >> 22) % shard_count
+
+
+class ShardFilter:
+    """Какие серверы обслуживает этот процесс.
+
+    Без явного списка шардов процесс отвечает за все серверы.
+    """
+
+    def __init__(self, shard_count=None, shard_ids=None):
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids if shard_count else None
+
+    @property
+    def partial(self):
+        return self.shard_ids is not None
+
+    def owns(self, guild_id):
+        if not self.partial:
+            return True
+        return shard_for(guild_id, self.shard_count) in self.shard_ids
+
+    def sql(self, column="guild_id"):
+        """Условие WHERE и параметры для выборки только своих серверов"""
+        if not self.partial:
+            return "TRUE", []
+        placeholders = ", ".join(["%s"] * len(self.shard_ids))
+        return (
+            f"MOD({column} >> 22, %s) IN ({placeholders})",
+            [self.shard_count, *self.shard_ids],
+        )
+
+    def __str__(self):
+        if not self.partial:
+            return "все серверы"
+        shard_ids = ", ".join(map(str, self.shard_ids))
+        return f"шарды {shard_ids} из {self.shard_count}"
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+from collections import Counter
+
+from dotenv import load_dotenv
+
+import db
+from retention import ARCHIVE_TABLE
+
+DAILY_QUERY = """
+    INSERT INTO stats_daily (guild_id, day, action, scope, events)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE events = events + VALUES(events)
+"""
+
+SCOPES_QUERY = """
+    INSERT INTO stats_scopes (guild_id, action, scope, events)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE events = events + VALUES(events)
+"""
+
+MODERATORS_QUERY = """
+    INSERT INTO stats_moderators (
+        guild_id, moderator_id, moderator_name, locks, unlocks,
+        last_action_at
+    ) VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        moderator_name = VALUES(moderator_name),
+        locks = locks + VALUES(locks),
+        unlocks = unlocks + VALUES(unlocks),
+        last_action_at = GREATEST(last_action_at, VALUES(last_action_at))
+"""
+
+ACTIVE_QUERY = """
+    INSERT INTO stats_active_locks (guild_id, scope, active)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE active = GREATEST(active + VALUES(active), 0)
+"""
+
+# журнал вместе с архивом — статистика за всё время
+ALL_LOGS = f"""
+    (
+        SELECT guild_id, moderator_id, moderator_name, action, scope,
+            created_at
+        FROM moderation_logs
+        UNION ALL
+        SELECT guild_id, moderator_id, moderator_name, action, scope,
+            created_at
+        FROM {ARCHIVE_TABLE}
+    ) AS logs
+"""
+
+BUILT_MARKER = "built"
+
+REBUILD_QUERIES = [
+    "DELETE FROM stats_daily",
+    "DELETE FROM stats_scopes",
+    "DELETE FROM stats_moderators",
+    "DELETE FROM stats_active_locks",
+    f"""
+    INSERT INTO stats_daily (guild_id, day, action, scope, events)
+    SELECT guild_id, DATE(created_at), action, scope, COUNT(*)
+    FROM {ALL_LOGS}
+    GROUP BY guild_id, DATE(created_at), action, scope
+    """,  # nosec B608 — запрос из констант
+    """
+    INSERT INTO stats_scopes (guild_id, action, scope, events)
+    SELECT guild_id, action, scope, SUM(events)
+    FROM stats_daily
+    GROUP BY guild_id, action, scope
+    """,
+    f"""
+    INSERT INTO stats_moderators (
+        guild_id, moderator_id, moderator_name, locks, unlocks,
+        last_action_at
+    )
+    SELECT
+        guild_id, moderator_id, MAX(moderator_name),
+        SUM(action = 'lock'), SUM(action = 'unlock'), MAX(created_at)
+    FROM {ALL_LOGS}
+    GROUP BY guild_id, moderator_id
+    """,  # nosec B608 — запрос из констант
+    """
+    INSERT INTO stats_active_locks (guild_id, scope, active)
+    SELECT guild_id, scope, COUNT(*)
+    FROM moderation_logs
+    WHERE action = 'lock' AND resolved = FALSE
+    GROUP BY guild_id, scope
+    """,
+]
+
+
+class StatsDelta:
+    """Изменения агрегатов от одной порции записей журнала.
+
+    Порция сворачивается в несколько строк на таблицу и применяется в
+    транзакции, которая пишет сами записи, — агрегаты не расходятся с
+    журналом при сбоях и повторной доставке.
+    """
+
+    def __init__(self):
+        self.daily = Counter()  # (guild_id, day, action, scope)
+        self.scopes = Counter()  # (guild_id, action, scope)
+        # (guild_id, moderator_id) -> [имя, блокировок, снятий, последнее]
+        self.moderators = {}
+        self.active = Counter()  # (guild_id, scope)
+
+    def add_event(
+        self,
+        guild_id,
+        action,
+        moderator_id,
+        moderator_name,
+        scope,
+        created_at,
+        resolved,
+    ):
+        self.daily[(guild_id, created_at.date(), action, scope)] += 1
+        self.scopes[(guild_id, action, scope)] += 1
+        entry = self.moderators.setdefault(
+            (guild_id, moderator_id), [moderator_name, 0, 0, created_at]
+        )
+        entry[0] = moderator_name
+        if action == "lock":
+            entry[1] += 1
+        elif action == "unlock":
+            entry[2] += 1
+        entry[3] = max(entry[3], created_at)
+        if action == "lock" and resolved is False:
+            self.active[(guild_id, scope)] += 1
+
+    def add_resolved(self, guild_id, scope, count):
+        if count > 0:
+            self.active[(guild_id, scope)] -= count
+
+    async def apply(self, cursor):
+        if self.daily:
+            await cursor.executemany(
+                DAILY_QUERY, [(*key, n) for key, n in self.daily.items()]
+            )
+        if self.scopes:
+            await cursor.executemany(
+                SCOPES_QUERY, [(*key, n) for key, n in self.scopes.items()]
+            )
+        if self.moderators:
+            await cursor.executemany(
+                MODERATORS_QUERY,
+                [(*key, *entry) for key, entry in self.moderators.items()],
+            )
+        active = [(*key, n) for key, n in self.active.items() if n]
+        if active:
+            await cursor.executemany(ACTIVE_QUERY, active)
+
+
+async def rebuild():
+    """Пересчитывает все агрегаты по журналу и архиву.
+
+    Полный проход по таблицам — для первого заполнения и исправления
+    расхождений, не для регулярного запуска.
+    """
+    async with db.transaction() as cursor:
+        for query in REBUILD_QUERIES:
+            await cursor.execute(query)
+        await cursor.execute(
+            """
+            INSERT INTO stats_meta (name, updated_at)
+            VALUES (%s, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE updated_at = VALUES(updated_at)
+            """,
+            (BUILT_MARKER,),
+        )
+
+
+async def ensure_built():
+    """Заполняет агрегаты, если их ещё не пересчитывали; True — если да"""
+    async with db.connection() as conn:
+        async with conn.cursor() as cursor:
+            # шарды стартуют одновременно — пересчитывает один
+            await cursor.execute("SELECT GET_LOCK('funzone_stats', 600)")
+            try:
+                await cursor.execute(
+                    "SELECT 1 FROM stats_meta WHERE name = %s",
+                    (BUILT_MARKER,),
+                )
+                if await cursor.fetchone():
+                    return False
+                await rebuild()
+                return True
+            finally:
+                await cursor.execute("SELECT RELEASE_LOCK('funzone_stats')")
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Пересчёт агрегатов статистики по журналу модерации"
+    )
+    parser.parse_args()
+    try:
+        await rebuild()
+        print("[Stats] Агрегаты пересчитаны")
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+# Discord не выдаёт таймаут длиннее 28 дней
+MAX_TIMEOUT = timedelta(days=28)
+# длинные и бессрочные блокировки продлеваются за сутки до конца таймаута
+RENEW_EVERY = MAX_TIMEOUT - timedelta(days=1)
+
+
+def timeout_until(expires_at, now):
+    """Конец таймаута, который нужно выдать сейчас; None — бессрочно"""
+    limit = now + MAX_TIMEOUT
+    if expires_at is None or expires_at > limit:
+        return limit
+    return expires_at
+
+
+def next_deadline(started_at, expires_at, now):
+    """Ближайший после now момент, когда блокировку на сервере нужно снять
+    или продлить таймаут.
+
+    Продления идут от started_at с шагом RENEW_EVERY, поэтому после
+    перезапуска получаются те же моменты, что и до него.
+    """
+    elapsed = max(now - started_at, timedelta(0))
+    renew_at = started_at + (elapsed // RENEW_EVERY + 1) * RENEW_EVERY
+    if expires_at is not None and expires_at <= renew_at:
+        return expires_at
+    return renew_at
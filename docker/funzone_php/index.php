@@ -1,5 +1,245 @@
 <?php
+// Панель статистики модерации. Читает только агрегаты stats_* (их ведёт
+// бот, см. discord_app/stats.py): на страницу — постоянное число коротких
+// запросов по первичным ключам, сколько бы записей ни было в журнале.
+// Результат кэшируется на CACHE_SECONDS, за это время БД не трогается.
 
-echo("Hello World!");
+const CACHE_SECONDS = 30;
+const DAYS = 30;
+const TOP_MODERATORS = 10;
 
-?>
\ No newline at end of file
+const ACTION_LABELS = ['lock' => 'Блокировки', 'unlock' => 'Разблокировки'];
+const SCOPE_LABELS = [
+    'channel' => 'Канал',
+    'server' => 'Сервер',
+    'voice' => 'Голос',
+];
+
+function connect()
+{
+    // лучше отдельный пользователь MySQL только с SELECT на stats_*
+    $user = getenv('DASHBOARD_MYSQL_USER') ?: getenv('MYSQL_USER');
+    $password = getenv('DASHBOARD_MYSQL_USER')
+        ? getenv('DASHBOARD_MYSQL_PASSWORD')
+        : getenv('MYSQL_PASSWORD');
+    $dsn = sprintf(
+        'mysql:host=%s;port=%d;dbname=%s;charset=utf8mb4',
+        getenv('MYSQL_HOST') ?: 'second_db',
+        (int)(getenv('MYSQL_PORT') ?: 3306),
+        getenv('MYSQL_DATABASE') ?: 'fun_zone_db'
+    );
+    return new PDO($dsn, $user, $password, [
+        PDO::ATTR_ERRMODE => PDO::ERRMODE_EXCEPTION,
+        PDO::ATTR_DEFAULT_FETCH_MODE => PDO::FETCH_ASSOC,
+        PDO::ATTR_EMULATE_PREPARES => false,
+        PDO::MYSQL_ATTR_INIT_COMMAND =>
+            'SET SESSION TRANSACTION READ ONLY',
+    ]);
+}
+
+function fetch_all(PDO $pdo, $query, array $args = [])
+{
+    $statement = $pdo->prepare($query);
+    $statement->execute($args);
+    return $statement->fetchAll();
+}
+
+function load_stats($guild)
+{
+    $pdo = connect();
+    $guilds = fetch_all(
+        $pdo,
+        'SELECT guild_id, SUM(events) AS events FROM stats_scopes
+         GROUP BY guild_id ORDER BY events DESC'
+    );
+    if ($guild === null && $guilds) {
+        $guild = (string)$guilds[0]['guild_id'];
+    }
+    $data = [
+        'guild' => $guild,
+        'guilds' => $guilds,
+        'active' => [],
+        'daily' => [],
+        'scopes' => [],
+        'moderators' => [],
+        'updated_at' => gmdate('Y-m-d H:i:s'),
+    ];
+    if ($guild === null) {
+        return $data;
+    }
+    $data['active'] = fetch_all(
+        $pdo,
+        'SELECT scope, active FROM stats_active_locks WHERE guild_id = ?',
+        [$guild]
+    );
+    $data['daily'] = fetch_all(
+        $pdo,
+        'SELECT day, action, SUM(events) AS events FROM stats_daily
+         WHERE guild_id = ? AND day >= UTC_DATE() - INTERVAL ? DAY
+         GROUP BY day, action ORDER BY day DESC',
+        [$guild, DAYS]
+    );
+    $data['scopes'] = fetch_all(
+        $pdo,
+        'SELECT action, scope, events FROM stats_scopes WHERE guild_id = ?
+         ORDER BY action, scope',
+        [$guild]
+    );
+    $data['moderators'] = fetch_all(
+        $pdo,
+        'SELECT moderator_name, locks, unlocks, last_action_at
+         FROM stats_moderators WHERE guild_id = ?
+         ORDER BY locks DESC LIMIT ' . TOP_MODERATORS,
+        [$guild]
+    );
+    return $data;
+}
+
+function cached_stats($guild)
+{
+    $path = sprintf(
+        '%s/funzone_stats_%s.json',
+        sys_get_temp_dir(),
+        $guild === null ? 'default' : $guild
+    );
+    $mtime = @filemtime($path);
+    if ($mtime !== false && time() - $mtime < CACHE_SECONDS) {
+        $data = json_decode((string)@file_get_contents($path), true);
+        if (is_array($data)) {
+            return $data;
+        }
+    }
+    $data = load_stats($guild);
+    // запись через rename, чтобы параллельный запрос не прочитал половину
+    $tmp = $path . '.' . getmypid();
+    if (@file_put_contents($tmp, json_encode($data)) !== false) {
+        @rename($tmp, $path);
+    }
+    return $data;
+}
+
+function h($value)
+{
+    return htmlspecialchars((string)$value, ENT_QUOTES, 'UTF-8');
+}
+
+function label(array $labels, $key)
+{
+    return $labels[$key] ?? $key;
+}
+
+$guild = $_GET['guild'] ?? null;
+if ($guild !== null && !ctype_digit($guild)) {
+    $guild = null;
+}
+
+try {
+    $stats = cached_stats($guild);
+} catch (PDOException $e) {
+    error_log('[Dashboard] Ошибка MySQL: ' . $e->getMessage());
+    http_response_code(503);
+    echo 'Статистика временно недоступна';
+    exit;
+}
+
+header('Cache-Control: max-age=' . CACHE_SECONDS);
+
+$daily = [];
+foreach ($stats['daily'] as $row) {
+    $daily[$row['day']][$row['action']] = $row['events'];
+}
+?>
+<!DOCTYPE html>
+<html lang="ru">
+<head>
+    <meta charset="utf-8">
+    <title>Статистика модерации</title>
+    <style>
+        body { font-family: sans-serif; margin: 2em; }
+        table { border-collapse: collapse; margin-bottom: 2em; }
+        th, td { border: 1px solid #ccc; padding: 4px 10px; }
+        td.number { text-align: right; }
+    </style>
+</head>
+<body>
+<h1>Статистика модерации</h1>
+
+<?php if (!$stats['guilds']): ?>
+    <p>Записей в журнале пока нет.</p>
+<?php else: ?>
+<form method="get">
+    <label>Сервер
+        <select name="guild" onchange="this.form.submit()">
+        <?php foreach ($stats['guilds'] as $row): ?>
+            <option value="<?= h($row['guild_id']) ?>"
+                <?= (string)$row['guild_id'] === (string)$stats['guild']
+                    ? 'selected' : '' ?>>
+                <?= h($row['guild_id']) ?> (событий: <?= h($row['events']) ?>)
+            </option>
+        <?php endforeach ?>
+        </select>
+    </label>
+</form>
+
+<h2>Активные блокировки</h2>
+<table>
+    <tr><th>Область</th><th>Сейчас</th></tr>
+    <?php foreach ($stats['active'] as $row): ?>
+    <tr>
+        <td><?= h(label(SCOPE_LABELS, $row['scope'])) ?></td>
+        <td class="number"><?= h($row['active']) ?></td>
+    </tr>
+    <?php endforeach ?>
+</table>
+
+<h2>За всё время</h2>
+<table>
+    <tr><th>Действие</th><th>Область</th><th>Событий</th></tr>
+    <?php foreach ($stats['scopes'] as $row): ?>
+    <tr>
+        <td><?= h(label(ACTION_LABELS, $row['action'])) ?></td>
+        <td><?= h(label(SCOPE_LABELS, $row['scope'])) ?></td>
+        <td class="number"><?= h($row['events']) ?></td>
+    </tr>
+    <?php endforeach ?>
+</table>
+
+<h2>По дням, последние <?= DAYS ?> дней (UTC)</h2>
+<table>
+    <tr>
+        <th>День</th>
+        <?php foreach (ACTION_LABELS as $text): ?>
+        <th><?= h($text) ?></th>
+        <?php endforeach ?>
+    </tr>
+    <?php foreach ($daily as $day => $events): ?>
+    <tr>
+        <td><?= h($day) ?></td>
+        <?php foreach (array_keys(ACTION_LABELS) as $action): ?>
+        <td class="number"><?= h($events[$action] ?? 0) ?></td>
+        <?php endforeach ?>
+    </tr>
+    <?php endforeach ?>
+</table>
+
+<h2>Модераторы</h2>
+<table>
+    <tr>
+        <th>Модератор</th><th>Блокировок</th><th>Разблокировок</th>
+        <th>Последнее действие (UTC)</th>
+    </tr>
+    <?php foreach ($stats['moderators'] as $row): ?>
+    <tr>
+        <td><?= h($row['moderator_name']) ?></td>
+        <td class="number"><?= h($row['locks']) ?></td>
+        <td class="number"><?= h($row['unlocks']) ?></td>
+        <td><?= h($row['last_action_at']) ?></td>
+    </tr>
+    <?php endforeach ?>
+</table>
+<?php endif ?>
+
+<p><small>Обновлено <?= h($stats['updated_at']) ?> UTC,
+    данные кэшируются на <?= CACHE_SECONDS ?> с.</small></p>
+</body>
+</html>